@@ -0,0 +1,250 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterable, Optional
+
+
+# Rough decoded-samples-per-encoded-byte ratios, used before a cover is decoded
+SAMPLES_PER_BYTE = {"wav": 0.5, "flac": 0.9, "ogg": 6.0, "mp3": 5.5}
+
+# Estimated CPU seconds per sample for each stage (single core, order of magnitude)
+DECODE_SECONDS = {"wav": 2e-9, "flac": 15e-9, "ogg": 40e-9, "mp3": 40e-9}
+EMBED_SECONDS = 5e-9
+RANDOM_SECONDS = 25e-9  # permutation of all samples (first use of a key/length)
+ENCODE_SECONDS = {"wav": 3e-9, "flac": 30e-9, "mp3": 100e-9, "delta": 0.0}
+PLAN_SECONDS = 8 * 5e-9  # LSB histogram per candidate: 2 modes x 4 n_lsb
+
+
+class Cost:
+    """Estimated resources of one request: CPU seconds and peak bytes."""
+
+    __slots__ = ("cpu_seconds", "memory_bytes")
+
+    def __init__(self, cpu_seconds: float, memory_bytes: int):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+
+    def __add__(self, other: "Cost") -> "Cost":
+        return Cost(self.cpu_seconds + other.cpu_seconds, self.memory_bytes + other.memory_bytes)
+
+    def to_dict(self) -> dict:
+        return {"cpu_seconds": round(self.cpu_seconds, 3), "memory_bytes": self.memory_bytes}
+
+
+def estimate_samples(encoded_bytes: int, fmt: str) -> int:
+    return int(encoded_bytes * SAMPLES_PER_BYTE.get(fmt, 1.0))
+
+
+def estimate_embed_cost(samples: int, fmt: str, n_lsb: int, use_random: bool,
+                        output_formats: Iterable[str], decoded: bool = False) -> Cost:
+    """Cost of decoding (unless already decoded), embedding and encoding the outputs."""
+    pcm = samples * 2
+    cpu = 0.0 if decoded else samples * DECODE_SECONDS.get(fmt, 40e-9)
+    cpu += samples * EMBED_SECONDS / n_lsb
+    memory = pcm * 2  # cover + stego copy
+    if use_random:
+        cpu += samples * RANDOM_SECONDS
+        memory += samples * 4  # int32 permutation
+    for out in output_formats:
+        cpu += samples * ENCODE_SECONDS.get(out, 30e-9)
+        if out != "delta":
+            memory += pcm * 7 // 3  # encoded output + its base64 text
+    return Cost(cpu, memory)
+
+
+def estimate_decode_cost(samples: int, fmt: str) -> Cost:
+    """Cost of decoding an encoded file into PCM (e.g. registering a library cover)."""
+    return Cost(samples * DECODE_SECONDS.get(fmt, 40e-9), samples * 2)
+
+
+def estimate_encode_cost(samples: int, fmt: str) -> Cost:
+    """Cost of loading a stored stego WAV and encoding it, e.g. the lazy MP3 download."""
+    cpu = samples * (DECODE_SECONDS["wav"] + ENCODE_SECONDS.get(fmt, 30e-9))
+    return Cost(cpu, samples * 2 + samples * 2 * 7 // 3)
+
+
+def estimate_plan_cost(samples: int, fmt: str, decoded: bool = False) -> Cost:
+    """Cost of decoding (unless already decoded) and scoring every plan candidate."""
+    cpu = 0.0 if decoded else samples * DECODE_SECONDS.get(fmt, 40e-9)
+    cpu += samples * PLAN_SECONDS
+    memory = samples * 2 + samples * 10  # cover + masked int16/int64 copies per pass
+    return Cost(cpu, memory)
+
+
+def estimate_extract_cost(samples: int, fmt: str, use_random: bool = True) -> Cost:
+    """Extraction cost; the mode is unknown until the header is read, so assume random."""
+    cpu = samples * (DECODE_SECONDS.get(fmt, 40e-9) + EMBED_SECONDS)
+    memory = samples * 2
+    if use_random:
+        cpu += samples * RANDOM_SECONDS
+        memory += samples * 4
+    return Cost(cpu, memory)
+
+
+class Overloaded(Exception):
+    """Request rejected by admission control; retry_after is in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    def __init__(self, client: str, cost: Cost, loop: asyncio.AbstractEventLoop):
+        self.client = client
+        self.cost = cost
+        self.loop = loop
+        self.future: asyncio.Future = loop.create_future()
+        self.enqueued = time.monotonic()
+        self.started: Optional[float] = None
+
+
+class AdmissionController:
+    """Admits requests against a global CPU/memory budget with fair per-client queues.
+
+    Requests that fit the remaining budget start immediately. Others wait in a
+    per-client FIFO; clients are served round-robin so one client's burst cannot
+    starve the rest. A request larger than the whole budget is clamped to it and
+    runs alone. When the queue is full, or a request waits longer than
+    max_wait_seconds, Overloaded is raised so the API can answer 429.
+    """
+
+    def __init__(self, cpu_budget: float, memory_budget: int, max_queue: int,
+                 max_queue_per_client: int, max_wait_seconds: float, workers: Optional[int] = None):
+        self.cpu_budget = cpu_budget
+        self.memory_budget = memory_budget
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.max_wait_seconds = max_wait_seconds
+        self.workers = workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._queues: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        self._cpu_used = 0.0
+        self._memory_used = 0
+        # Observed wall seconds per estimated CPU second (for Retry-After)
+        self._time_scale = 1.0
+        self.rejected = 0
+
+    def _clamp(self, cost: Cost) -> Cost:
+        return Cost(min(cost.cpu_seconds, self.cpu_budget), min(cost.memory_bytes, self.memory_budget))
+
+    def _fits(self, cost: Cost) -> bool:
+        return (self._running == 0 or
+                (self._cpu_used + cost.cpu_seconds <= self.cpu_budget
+                 and self._memory_used + cost.memory_bytes <= self.memory_budget))
+
+    def _start(self, ticket: Ticket) -> None:
+        self._running += 1
+        self._cpu_used += ticket.cost.cpu_seconds
+        self._memory_used += ticket.cost.memory_bytes
+        ticket.started = time.monotonic()
+
+    def retry_after(self) -> int:
+        with self._lock:
+            return self._retry_after()
+
+    def _retry_after(self) -> int:
+        backlog = self._cpu_used + sum(t.cost.cpu_seconds for q in self._queues.values() for t in q)
+        return max(1, math.ceil(backlog * self._time_scale / self.workers))
+
+    async def acquire(self, client: str, cost: Cost) -> Ticket:
+        ticket = Ticket(client, self._clamp(cost), asyncio.get_running_loop())
+        with self._lock:
+            if self._queued == 0 and self._fits(ticket.cost):
+                self._start(ticket)
+                return ticket
+            queue = self._queues.get(client)
+            if self._queued >= self.max_queue or (queue and len(queue) >= self.max_queue_per_client):
+                self.rejected += 1
+                raise Overloaded(self._retry_after())
+            self._queues.setdefault(client, deque()).append(ticket)
+            self._queued += 1
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self.max_wait_seconds)
+            return ticket
+        except asyncio.TimeoutError:
+            with self._lock:
+                if ticket.started is None:
+                    self._dequeue(ticket)
+                    self.rejected += 1
+                    raise Overloaded(self._retry_after())
+            # Granted while timing out: keep the slot
+            return ticket
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = ticket.started is None
+                if queued:
+                    self._dequeue(ticket)
+            if not queued:
+                self.release(ticket)
+            raise
+
+    def _dequeue(self, ticket: Ticket) -> None:
+        queue = self._queues.get(ticket.client)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            self._queued -= 1
+            if not queue:
+                del self._queues[ticket.client]
+            self._dispatch()
+
+    def release(self, ticket: Ticket) -> None:
+        """Return a ticket's budget; safe to call from any thread."""
+        with self._lock:
+            if ticket.started is None:
+                return
+            elapsed = time.monotonic() - ticket.started
+            if ticket.cost.cpu_seconds > 0:
+                observed = elapsed / ticket.cost.cpu_seconds
+                self._time_scale = 0.9 * self._time_scale + 0.1 * min(observed, 100.0)
+            self._running -= 1
+            self._cpu_used -= ticket.cost.cpu_seconds
+            self._memory_used -= ticket.cost.memory_bytes
+            ticket.started = None
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        # Round-robin over clients; the oldest waiter blocks skipping once it is
+        # halfway to its deadline so large requests are not starved by small ones
+        granted = True
+        while granted and self._queues:
+            granted = False
+            oldest = min((q[0] for q in self._queues.values()), key=lambda t: t.enqueued)
+            if time.monotonic() - oldest.enqueued > self.max_wait_seconds / 2:
+                candidates = [oldest.client]
+            else:
+                candidates = list(self._queues)
+            for client in candidates:
+                queue = self._queues.get(client)
+                if not queue or not self._fits(queue[0].cost):
+                    continue
+                ticket = queue.popleft()
+                self._queued -= 1
+                if queue:
+                    self._queues.move_to_end(client)
+                else:
+                    del self._queues[client]
+                self._start(ticket)
+                ticket.loop.call_soon_threadsafe(self._grant, ticket)
+                granted = True
+
+    @staticmethod
+    def _grant(ticket: Ticket) -> None:
+        if not ticket.future.done():
+            ticket.future.set_result(True)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": self._queued,
+                "cpu_used_seconds": self._cpu_used,
+                "memory_used_bytes": self._memory_used,
+                "rejected_total": self.rejected,
+            }
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Union
+
+import numpy as np
+
+from script import AudioSteganography, CoverSession
+from store import QuotaExceededError
+
+
+class CoverLibrary:
+    """Server-side covers registered once and addressed by content hash.
+
+    Each cover is decoded on registration and its PCM is stored as
+    root/<cover_id>/pcm.npy next to meta.json (format, capacity per n_lsb).
+    Recently used covers are kept decoded in memory up to max_hot_bytes;
+    the rest are memory-mapped from disk on demand, so no cover is decoded
+    twice.
+
+    Like ArtifactStore, the library has a disk quota and a TTL: covers not
+    used within ttl_seconds are removed by the sweeper, and least recently
+    used covers are evicted when a registration would exceed quota_bytes.
+    Last use is persisted as the mtime of meta.json so it survives restarts.
+    """
+
+    N_LSB_RANGE = range(1, 5)
+    TMP_SUFFIX = ".part"
+    KEY_LOCK_STRIPES = 64
+
+    def __init__(self, root: Path, max_hot_bytes: int, quota_bytes: int, ttl_seconds: float):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_hot_bytes = max_hot_bytes
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # Fixed stripe table: ids of failed or deleted registrations must not grow it
+        self._key_locks = [threading.Lock() for _ in range(self.KEY_LOCK_STRIPES)]
+        self._hot: "OrderedDict[str, CoverSession]" = OrderedDict()
+        self._hot_bytes = 0
+        self._sizes: Dict[str, int] = {}  # cover_id -> bytes on disk
+        self._last_access: Dict[str, float] = {}
+        self._used = 0
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def used_bytes(self) -> int:
+        return self._used
+
+    @staticmethod
+    def _valid(cover_id: str) -> bool:
+        return len(cover_id) == 64 and all(c in "0123456789abcdef" for c in cover_id)
+
+    def _dir(self, cover_id: str) -> Path:
+        return self.root / cover_id
+
+    def _cover_lock(self, cover_id: str) -> threading.Lock:
+        return self._key_locks[hash(cover_id) % self.KEY_LOCK_STRIPES]
+
+    @staticmethod
+    def content_id(source: Union[bytes, BinaryIO]) -> str:
+        """SHA-256 of the encoded cover file; file-like sources are rewound."""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return hashlib.sha256(source).hexdigest()
+        digest = hashlib.sha256()
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+        source.seek(0)
+        return digest.hexdigest()
+
+    def register(self, source: Union[bytes, BinaryIO], filename: str = "",
+                 format: Optional[str] = None) -> Optional[dict]:
+        """Decode and store a cover; returns its metadata, or None if it cannot be decoded.
+
+        Registering the same content again returns the existing entry without decoding.
+        """
+        cover_id = self.content_id(source)
+        with self._cover_lock(cover_id):
+            existing = self.get(cover_id)
+            if existing is not None:
+                self._touch(cover_id)
+                return existing
+
+            stego = AudioSteganography()
+            if not stego.load_audio(source, format):
+                return None
+
+            tmp_dir = self.root / f"{cover_id}{self.TMP_SUFFIX}"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            tmp_dir.mkdir(parents=True)
+            np.save(tmp_dir / "pcm.npy", stego.audio_data)
+            meta = {
+                "cover_id": cover_id,
+                "filename": filename,
+                "sample_rate": stego.sample_rate,
+                "channels": stego.channels,
+                "samples": int(stego.audio_data.size),
+                "duration_seconds": round(len(stego.audio_data) / stego.sample_rate, 3),
+                "pcm_bytes": int(stego.audio_data.nbytes),
+                "capacity": {str(n): stego.calculate_capacity(n) for n in self.N_LSB_RANGE},
+                "created": time.time(),
+            }
+            with open(tmp_dir / "meta.json", "w") as f:
+                json.dump(meta, f)
+            size = sum(item.stat().st_size for item in tmp_dir.iterdir())
+            try:
+                with self._lock:
+                    self._make_room(size, keep=cover_id)
+                    self._sizes[cover_id] = size
+                    self._used += size
+                    self._last_access[cover_id] = time.time()
+            except QuotaExceededError:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+            os.replace(tmp_dir, self._dir(cover_id))
+
+            # The freshly decoded PCM is likely to be used right away
+            self._make_hot(cover_id, CoverSession.from_engine(stego))
+            return meta
+
+    def get(self, cover_id: str) -> Optional[dict]:
+        if not self._valid(cover_id):
+            return None
+        try:
+            with open(self._dir(cover_id) / "meta.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def list(self) -> List[dict]:
+        covers = []
+        for path in sorted(self.root.iterdir()):
+            meta = self.get(path.name)
+            if meta is not None:
+                covers.append(meta)
+        return covers
+
+    def session(self, cover_id: str) -> Optional[CoverSession]:
+        """Read-only decoded cover: from memory if hot, otherwise memory-mapped from disk."""
+        with self._lock:
+            session = self._hot.get(cover_id)
+            if session is not None:
+                self._hot.move_to_end(cover_id)
+        if session is not None:
+            self._touch(cover_id)
+            return session
+
+        meta = self.get(cover_id)
+        if meta is None:
+            return None
+        self._touch(cover_id)
+        pcm = np.load(self._dir(cover_id) / "pcm.npy", mmap_mode="r")
+        if pcm.nbytes > self.max_hot_bytes:
+            # Too big to keep resident: serve straight from the mapping
+            return CoverSession(pcm, meta["sample_rate"], meta["channels"])
+        session = CoverSession(np.array(pcm), meta["sample_rate"], meta["channels"])
+        self._make_hot(cover_id, session)
+        return session
+
+    def _make_hot(self, cover_id: str, session: CoverSession) -> None:
+        size = session.audio_data.nbytes
+        if size > self.max_hot_bytes:
+            return
+        with self._lock:
+            if cover_id in self._hot:
+                self._hot.move_to_end(cover_id)
+                return
+            while self._hot and self._hot_bytes + size > self.max_hot_bytes:
+                _, evicted = self._hot.popitem(last=False)
+                self._hot_bytes -= evicted.audio_data.nbytes
+            self._hot[cover_id] = session
+            self._hot_bytes += size
+
+    def _touch(self, cover_id: str) -> None:
+        now = time.time()
+        with self._lock:
+            if cover_id not in self._sizes:
+                return
+            previous = self._last_access.get(cover_id, 0)
+            self._last_access[cover_id] = now
+        # Persist at most once a minute; only the TTL needs it
+        if now - previous > 60:
+            try:
+                os.utime(self._dir(cover_id) / "meta.json", (now, now))
+            except OSError:
+                pass
+
+    def delete(self, cover_id: str) -> bool:
+        if self.get(cover_id) is None:
+            return False
+        with self._cover_lock(cover_id):
+            with self._lock:
+                self._forget(cover_id)
+            shutil.rmtree(self._dir(cover_id), ignore_errors=True)
+        return True
+
+    def _forget(self, cover_id: str) -> None:
+        """Drop a cover from the index and hot set; caller holds self._lock."""
+        session = self._hot.pop(cover_id, None)
+        if session is not None:
+            self._hot_bytes -= session.audio_data.nbytes
+        self._used -= self._sizes.pop(cover_id, 0)
+        self._last_access.pop(cover_id, None)
+
+    def _make_room(self, needed: int, keep: Optional[str] = None) -> None:
+        """Evict least recently used covers until needed bytes fit; caller holds self._lock."""
+        if needed > self.quota_bytes:
+            raise QuotaExceededError(f"Cover of {needed} bytes exceeds cover library quota")
+        candidates = sorted((t, k) for k, t in self._last_access.items() if k != keep)
+        for _, cover_id in candidates:
+            if self._used + needed <= self.quota_bytes:
+                break
+            self._forget(cover_id)
+            # Open sessions keep their mapping; the files go away once they are closed
+            shutil.rmtree(self._dir(cover_id), ignore_errors=True)
+        if self._used + needed > self.quota_bytes:
+            raise QuotaExceededError("Cover library quota exceeded")
+
+    def sweep(self) -> int:
+        """Delete covers not used within the TTL. Returns number of covers removed."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [cover_id for cover_id, t in self._last_access.items() if t < cutoff]
+        for cover_id in expired:
+            self.delete(cover_id)
+        return len(expired)
+
+    def reconcile(self) -> None:
+        """Rebuild the index from disk, dropping half-written registrations left by a crash."""
+        with self._lock:
+            self._sizes.clear()
+            self._last_access.clear()
+            self._used = 0
+            for path in self.root.iterdir():
+                if path.name.endswith(self.TMP_SUFFIX) or self.get(path.name) is None:
+                    shutil.rmtree(path, ignore_errors=True)
+                    continue
+                size = sum(item.stat().st_size for item in path.iterdir())
+                self._sizes[path.name] = size
+                self._used += size
+                self._last_access[path.name] = (path / "meta.json").stat().st_mtime
+        self.sweep()
+        with self._lock:
+            self._make_room(0)
+
+    def start_sweeper(self, interval_seconds: float) -> None:
+        if self._sweeper is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Warning: cover sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="cover-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
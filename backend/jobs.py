@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from script import CancellationToken
+
+
+class Job:
+    """A running embed/extract request: its cancellation token and last progress.
+
+    owner is the client that started it; only that client can see or cancel it.
+    """
+
+    def __init__(self, job_id: str, kind: str, owner: Optional[str] = None):
+        self.id = job_id
+        self.kind = kind
+        self.owner = owner
+        self.token = CancellationToken()
+        self.created = time.time()
+        self.progress: Dict[str, object] = {"stage": "queued", "done": 0, "total": 0}
+
+    def update_progress(self, stage: str, done: int, total: int) -> None:
+        self.progress = {"stage": stage, "done": done, "total": total}
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "cancelled": self.token.cancelled,
+            "elapsed": round(time.time() - self.created, 3),
+            **self.progress,
+        }
+
+
+class JobRegistry:
+    """Jobs currently in flight, addressable by id for progress and cancellation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+
+    def create(self, kind: str, job_id: Optional[str] = None, owner: Optional[str] = None) -> Job:
+        with self._lock:
+            if not job_id or not job_id.isalnum() or job_id in self._jobs:
+                job_id = uuid.uuid4().hex
+            job = Job(job_id, kind, owner)
+            self._jobs[job_id] = job
+            return job
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Job]:
+        """The job, or None if it is unknown or (with owner) belongs to another client."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def remove(self, job_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def cancel(self, job_id: str, owner: Optional[str] = None) -> bool:
+        job = self.get(job_id, owner)
+        if job is None:
+            return False
+        job.token.cancel()
+        return True
+
+    def list(self, owner: Optional[str] = None) -> list:
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values() if owner is None or job.owner == owner]
+
+
+async def run_cancellable(request: Request, job: Job, fn: Callable, *args,
+                          poll_seconds: float = 0.25):
+    """Run blocking fn(*args) in a worker thread, cancelling job if the client disconnects."""
+    task = asyncio.ensure_future(run_in_threadpool(fn, *args))
+    while not task.done():
+        done, _ = await asyncio.wait({task}, timeout=poll_seconds)
+        if not done and not job.token.cancelled and await request.is_disconnected():
+            job.token.cancel()
+    return task.result()
@@ -1,26 +1,224 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
 import base64
+import hashlib
+import io
+import multiprocessing
 import os
-from typing import Optional
+import threading
+import wave
+from contextlib import asynccontextmanager
+from concurrent.futures import (FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor,
+                                TimeoutError as FutureTimeout, wait)
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
 
-import numpy as np
-from pydub import AudioSegment
-from fastapi import FastAPI, UploadFile, Form, File
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, Form, File, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.datastructures import UploadFile as StarletteUploadFile
 from pathlib import Path
-from fastapi.staticfiles import StaticFiles
 
-import uvicorn
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 
-from script import  AudioSteganography
+from script import  (AudioSteganography, CancellationToken, OperationCancelled, PCMEncodeStream,
+                     PermutationCache, StegoDelta, embed_sharded, extract_sharded, ffmpeg_tools)
+from admission import (AdmissionController, Cost, Overloaded, estimate_decode_cost, estimate_embed_cost,
+                       estimate_encode_cost, estimate_extract_cost, estimate_plan_cost, estimate_samples)
+from covers import CoverLibrary
+from jobs import Job, JobRegistry, run_cancellable
+from metrics import Metrics
+from shm import SharedPCM, SharedPCMRegistry, embed_shared, init_worker
+from store import ArtifactStore, QuotaExceededError, ResultCache, UploadSessions
 
 BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_DIR = BASE_DIR / "uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-app = FastAPI(title="Audio Steganography API")
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# Semua file yang ditulis API disimpan di artifact store (kuota + TTL)
+ARTIFACTS = ArtifactStore(
+    UPLOAD_DIR / "artifacts",
+    quota_bytes=int(os.environ.get("ARTIFACT_QUOTA_BYTES", str(2 * 1024 ** 3))),
+    ttl_seconds=float(os.environ.get("ARTIFACT_TTL_SECONDS", "3600")),
+)
+ARTIFACT_SWEEP_SECONDS = float(os.environ.get("ARTIFACT_SWEEP_SECONDS", "60"))
+
+# Upload resumable untuk cover besar; sesi yang tidak disentuh selama TTL dihapus
+UPLOADS = UploadSessions(
+    UPLOAD_DIR / "sessions",
+    ttl_seconds=float(os.environ.get("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600))),
+    max_upload_bytes=int(os.environ.get("MAX_UPLOAD_BYTES", str(8 * 1024 ** 3))),
+    quota_bytes=int(os.environ.get("UPLOAD_QUOTA_BYTES", str(32 * 1024 ** 3))),
+    # Sesi yang belum selesai diunggah dianggap ditinggalkan lebih cepat
+    abandoned_ttl_seconds=float(os.environ.get("UPLOAD_ABANDONED_TTL_SECONDS", "3600")),
+)
+
+# Jumlah thread untuk embedding/ekstraksi per segmen (0 = semua core)
+STEGO_WORKERS = int(os.environ.get("STEGO_WORKERS", "0")) or None
+# Permutasi posisi acak dipakai ulang antar request (seed + panjang cover sama)
+PERMUTATION_CACHE_CONFIG = dict(
+    max_bytes=int(os.environ.get("PERMUTATION_CACHE_BYTES", str(512 * 1024 ** 2))),
+    spill_dir=os.environ.get("PERMUTATION_SPILL_DIR") or None,
+    spill_max_bytes=int(os.environ["PERMUTATION_SPILL_MAX_BYTES"])
+    if os.environ.get("PERMUTATION_SPILL_MAX_BYTES") else None,
+)
+PERMUTATION_CACHE = PermutationCache(**PERMUTATION_CACHE_CONFIG)
+
+# Profil memori per tahap (tracemalloc + RSS) untuk semua request; bisa juga per request
+PROFILE_MEMORY = os.environ.get("PROFILE_MEMORY", "").lower() in ("1", "true", "yes", "on")
+METRICS = Metrics()
+
+
+def engine_options(job: Optional[Job] = None, profile_memory: bool = False) -> dict:
+    return dict(
+        workers=STEGO_WORKERS,
+        permutation_cache=PERMUTATION_CACHE,
+        progress_callback=job.update_progress if job else None,
+        cancel_token=job.token if job else None,
+        profile_memory=profile_memory or PROFILE_MEMORY,
+    )
+
+
+def new_engine(job: Optional[Job] = None, profile_memory: bool = False) -> AudioSteganography:
+    return AudioSteganography(**engine_options(job, profile_memory))
+
+
+# Cover yang didaftarkan sekali (id = hash konten); PCM disimpan hot di memori atau di-mmap
+COVERS = CoverLibrary(
+    UPLOAD_DIR / "covers",
+    max_hot_bytes=int(os.environ.get("COVER_HOT_BYTES", str(1024 ** 3))),
+    quota_bytes=int(os.environ.get("COVER_QUOTA_BYTES", str(4 * 1024 ** 3))),
+    ttl_seconds=float(os.environ.get("COVER_TTL_SECONDS", str(7 * 24 * 3600))),
+)
+
+
+# Hasil /embed untuk request identik (retry gateway); 0 = nonaktif
+RESULT_CACHE = ResultCache(int(os.environ.get("RESULT_CACHE_BYTES", str(256 * 1024 ** 2))), ARTIFACTS)
+
+# Admission control: biaya request diperkirakan di awal dan dibatasi budget CPU/memori global;
+# sisanya antre adil per klien, lalu 429 + Retry-After saat antrean penuh
+ADMISSION = AdmissionController(
+    cpu_budget=float(os.environ.get("ADMISSION_CPU_SECONDS", str(2.0 * (os.cpu_count() or 1)))),
+    memory_budget=int(os.environ.get("ADMISSION_MEMORY_BYTES", str(2 * 1024 ** 3))),
+    max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", "64")),
+    max_queue_per_client=int(os.environ.get("ADMISSION_MAX_QUEUE_PER_CLIENT", "8")),
+    max_wait_seconds=float(os.environ.get("ADMISSION_MAX_WAIT_SECONDS", "30")),
+)
+
+# Job embed/extract yang sedang berjalan (progress + pembatalan)
+JOBS = JobRegistry()
+
+
+# Pool untuk tahap setelah embedding (export, PSNR, base64)
+STAGE_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("STAGE_WORKERS", "4")))
+
+# Embedding di proses worker (0 = nonaktif, embedding di thread). PCM cover dan stego
+# dipertukarkan lewat shared memory; antar proses hanya nama blok dan bentuk array.
+PROCESS_WORKERS = int(os.environ.get("PROCESS_WORKERS", "0"))
+PROCESS_POOL = ProcessPoolExecutor(
+    max_workers=PROCESS_WORKERS,
+    # Bukan fork: proses API sudah punya thread (sweeper, pool) saat worker dibuat
+    mp_context=multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"),
+    # Worker membangun cache permutasinya sendiri dengan batas yang sama (per proses)
+    initializer=init_worker,
+    initargs=(PERMUTATION_CACHE_CONFIG,),
+) if PROCESS_WORKERS > 0 else None
+SHARED_PCM = SharedPCMRegistry()
+
+# Warmup saat boot: decode, embed dan encode kecil agar request pertama tidak membayar
+# import pydub, pencarian ffmpeg, dan pemanggilan codec pertama. /ready menunggu ini.
+# FLAC ikut default: menemukan ffmpeg dan spawn codec pertama adalah biaya cold start terbesar
+WARMUP_FORMATS = os.environ.get("WARMUP_FORMATS", "wav,flac")
+WARMUP_ENABLED = os.environ.get("WARMUP", "1").lower() not in ("0", "false", "no", "off")
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "1000"))
+FIRST_REQUEST_BUDGET_MS = float(os.environ.get("FIRST_REQUEST_BUDGET_MS", "500"))
+STARTUP = {"ready": False, "import_ms": None, "warmup_ms": None, "warmup_errors": [],
+           "first_request_ms": None}
+_first_request_lock = threading.Lock()
+
+
+def tiny_wav(frames: int = 4410, sample_rate: int = 44100) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(bytes(frames * 4))
+    return buffer.getvalue()
+
+
+def warmup() -> None:
+    """Run a tiny decode -> embed -> extract -> encode cycle, then mark the API ready."""
+    start = time.perf_counter()
+    try:
+        stego = new_engine()
+        if not stego.load_audio(tiny_wav(), format="wav"):
+            raise RuntimeError("warmup decode failed")
+        if not stego.embed_bytes(b"warmup", "warmup.txt", "warmup-key", n_lsb=2, use_random=True):
+            raise RuntimeError("warmup embed failed")
+        header = stego.read_header()
+        if header is None:
+            raise RuntimeError("warmup extract failed")
+        b"".join(stego.iter_secret(header[0], header[1], "warmup-key"))
+        for fmt in parse_output_formats(WARMUP_FORMATS):
+            try:
+                encoded = stego.to_bytes(fmt)
+                # Format terkompresi juga di-decode balik (jalur ffmpeg/ffprobe untuk upload)
+                if fmt != "wav" and not new_engine().load_audio(encoded, format=fmt):
+                    raise RuntimeError("decode failed")
+            except Exception as e:
+                STARTUP["warmup_errors"].append(f"encode {fmt}: {e}")
+    except Exception as e:
+        STARTUP["warmup_errors"].append(str(e))
+    STARTUP["warmup_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    STARTUP["ready"] = True
+    print(f"Warmup selesai dalam {STARTUP['warmup_ms']} ms"
+          + (f" (error: {'; '.join(STARTUP['warmup_errors'])})" if STARTUP["warmup_errors"] else ""))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ARTIFACTS.reconcile()
+    ARTIFACTS.start_sweeper(ARTIFACT_SWEEP_SECONDS)
+    UPLOADS.reconcile()
+    COVERS.reconcile()
+    COVERS.start_sweeper(ARTIFACT_SWEEP_SECONDS)
+    UPLOADS.start_sweeper(ARTIFACT_SWEEP_SECONDS)
+    if WARMUP_ENABLED:
+        # Di thread agar server sudah menerima koneksi (mis. /ready) selama warmup
+        threading.Thread(target=warmup, name="warmup", daemon=True).start()
+    else:
+        STARTUP["ready"] = True
+    yield
+    UPLOADS.stop_sweeper()
+    ARTIFACTS.stop_sweeper()
+    COVERS.stop_sweeper()
+    if PROCESS_POOL is not None:
+        PROCESS_POOL.shutdown(cancel_futures=True)
+    SHARED_PCM.release_all()
+
+
+app = FastAPI(title="Audio Steganography API", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def measure_first_request(request: Request, call_next):
+    if STARTUP["first_request_ms"] is not None or request.url.path in ("/ready", "/metrics"):
+        return await call_next(request)
+    start = time.perf_counter()
+    response = await call_next(request)
+    with _first_request_lock:
+        if STARTUP["first_request_ms"] is None:
+            STARTUP["first_request_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            if STARTUP["first_request_ms"] > FIRST_REQUEST_BUDGET_MS:
+                print(f"⚠ Request pertama {STARTUP['first_request_ms']} ms melebihi budget "
+                      f"{FIRST_REQUEST_BUDGET_MS} ms ({request.url.path})")
+    return response
 
 # Allow CORS (optional)
 app.add_middleware(
@@ -29,23 +227,111 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Content-Disposition", "X-Job-Id"],
 )
 
 
 
 
-def save_uploaded_file(upload: StarletteUploadFile, subdir: str = "") -> str:
-    subdir_path = UPLOAD_DIR / subdir
-    subdir_path.mkdir(parents=True, exist_ok=True)
-    
-    filename = upload.filename
-    # if subdir == "secrets":
-    # else:
-    #     filename = f"{int(time.time()*1000)}_{upload.filename}"
-    file_path = subdir_path / filename
-    with open(file_path, "wb") as f:
-        f.write(upload.file.read())
-    return str(file_path)
+def upload_format(upload: StarletteUploadFile) -> str:
+    return os.path.splitext(upload.filename or "")[1].lower().lstrip(".")
+
+
+async def run_blocking(request: Optional[Request], job: Optional[Job], fn: Callable, *args):
+    """Run blocking fn off the event loop; cancellable on disconnect when request and job are given."""
+    if request is not None and job is not None:
+        return await run_cancellable(request, job, fn, *args)
+    return await run_in_threadpool(fn, *args)
+
+
+async def load_audio_source(stego: AudioSteganography, upload: Optional[StarletteUploadFile],
+                            upload_id: Optional[str], label: str, request: Optional[Request] = None,
+                            job: Optional[Job] = None,
+                            data: Optional[bytes] = None) -> Tuple[Optional[str], Optional[JSONResponse]]:
+    """Load audio from a multipart file or a finalized resumable upload.
+
+    Decoding runs in a worker thread so the event loop stays responsive; with
+    request and job it is also cancelled when the client disconnects.
+    data is the multipart body when the caller already read it (cover_digest).
+    Returns (source filename, None) on success or (None, error response).
+    """
+    if upload_id:
+        try:
+            f, meta = UPLOADS.open(upload_id)
+        except KeyError:
+            return None, JSONResponse({"success": False, "error": "Unknown or unfinished upload_id"}, status_code=404)
+        with f:
+            ext = os.path.splitext(meta["filename"])[1].lstrip(".")
+            ok = await run_blocking(request, job, stego.load_audio, f, ext or None)
+        filename = meta["filename"]
+    elif upload is not None:
+        if data is None:
+            data = await upload.read()
+        ok = await run_blocking(request, job, stego.load_audio, data, upload_format(upload))
+        filename = upload.filename or ""
+    else:
+        return None, JSONResponse({"success": False, "error": f"{label}_file or upload_id required"}, status_code=400)
+
+    if not ok:
+        return None, JSONResponse({"success": False, "error": f"Failed to load {label} audio"}, status_code=500)
+    return filename, None
+
+
+async def open_cover(options: dict, upload: Optional[StarletteUploadFile], upload_id: Optional[str],
+                     cover_id: Optional[str], request: Optional[Request] = None,
+                     job: Optional[Job] = None,
+                     data: Optional[bytes] = None) -> Tuple[Optional[AudioSteganography], Optional[str], Optional[JSONResponse]]:
+    """Engine loaded with the cover: a registered cover_id (no decode) or an uploaded file.
+
+    Returns (engine, source filename, None) on success or (None, None, error response).
+    """
+    if cover_id:
+        # Cover dingin dibaca dari disk ke memori; jangan di event loop
+        session = await run_in_threadpool(COVERS.session, cover_id)
+        if session is None:
+            return None, None, JSONResponse({"success": False, "error": "Unknown cover_id"}, status_code=404)
+        return session.new_engine(**options), COVERS.get(cover_id)["filename"], None
+
+    stego = AudioSteganography(**options)
+    filename, error = await load_audio_source(stego, upload, upload_id, "cover", request, job, data)
+    if error is not None:
+        return None, None, error
+    return stego, filename, None
+
+
+async def cover_digest(upload: Optional[StarletteUploadFile], upload_id: Optional[str],
+                       cover_id: Optional[str]) -> Tuple[Optional[str], Optional[bytes]]:
+    """SHA-256 of the encoded cover bytes (same value as a library cover_id).
+
+    Returns (digest, multipart body); the body is handed on to open_cover so
+    the upload is only read once.
+    """
+    if cover_id:
+        return cover_id, None
+    if upload_id:
+        try:
+            f, _ = UPLOADS.open(upload_id)
+        except KeyError:
+            return None, None
+        with f:
+            return await run_in_threadpool(CoverLibrary.content_id, f), None
+    if upload is not None:
+        data = await upload.read()
+        return await run_in_threadpool(CoverLibrary.content_id, data), data
+    return None, None
+
+
+def cover_file_name(upload: Optional[StarletteUploadFile], upload_id: Optional[str],
+                    cover_id: Optional[str]) -> str:
+    """Response file_name for this request's cover; not part of the result cache key."""
+    filename = None
+    if cover_id:
+        filename = (COVERS.get(cover_id) or {}).get("filename")
+    elif upload_id:
+        filename = (UPLOADS.get(upload_id) or {}).get("filename")
+    elif upload is not None:
+        filename = upload.filename
+    return os.path.splitext(os.path.basename(filename or "cover"))[0]
 
 
 def parse_bool(value) -> bool:
@@ -57,80 +343,457 @@ def parse_bool(value) -> bool:
     return v in ("1", "true", "yes", "y")
 
 
+def client_key(request: Request) -> str:
+    """Identity used for fair queueing: X-Client-Id header, else the peer address."""
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "anonymous")
+
+
+def audio_source_size(upload: Optional[StarletteUploadFile], upload_id: Optional[str],
+                      cover_id: Optional[str] = None) -> Tuple[int, str, bool]:
+    """(estimated decoded samples, format, already decoded) before touching the audio."""
+    if cover_id:
+        meta = COVERS.get(cover_id)
+        return (meta["samples"], "wav", True) if meta else (0, "wav", True)
+    if upload_id:
+        meta = UPLOADS.get(upload_id)
+        if meta is None:
+            return 0, "", False
+        fmt = os.path.splitext(meta["filename"])[1].lower().lstrip(".")
+        return estimate_samples(meta["total_size"], fmt), fmt, False
+    if upload is not None:
+        size = upload.size
+        if size is None:
+            upload.file.seek(0, os.SEEK_END)
+            size = upload.file.tell()
+            upload.file.seek(0)
+        fmt = upload_format(upload)
+        return estimate_samples(size, fmt), fmt, False
+    return 0, "", False
+
+
+def overloaded_response(e: Overloaded) -> JSONResponse:
+    return JSONResponse(
+        {"success": False, "error": "Server busy, retry later", "retry_after": e.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def parse_csv(value: Optional[str]) -> List[str]:
+    return [item.strip() for item in str(value or "").split(",") if item.strip()]
+
+
+def parse_output_formats(value: Optional[str]) -> List[str]:
+    formats = []
+    for item in str(value or "").split(","):
+        fmt = item.strip().lower()
+        if fmt and fmt not in formats:
+            formats.append(fmt)
+    return formats
+
+
+def encode_to_b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("utf-8")
+
+
+def profiled_b64(stego: AudioSteganography, data: bytes) -> str:
+    with stego._stage("encode"):
+        return encode_to_b64(data)
+
+
+
+
+def run_stage_graph(stages: Dict[str, Tuple[Callable, List[str]]], executor: Executor,
+                    cancel_token: Optional[CancellationToken] = None):
+    """Run stages {name: (fn, deps)} on executor as soon as their deps are done.
+
+    Each stage receives the results of its deps as positional arguments.
+    Returns (results, timings) where timings are per-stage wall-clock seconds.
+    If cancel_token is cancelled, no further stages are started.
+    """
+    def timed(fn, args):
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - start
+
+    results, timings = {}, {}
+    pending = dict(stages)
+    running = {}
+    while pending or running:
+        if cancel_token is not None and cancel_token.cancelled:
+            wait(running)
+            cancel_token.raise_if_cancelled()
+        for name, (fn, deps) in list(pending.items()):
+            if all(dep in results for dep in deps):
+                running[executor.submit(timed, fn, [results[dep] for dep in deps])] = name
+                del pending[name]
+        if not running:
+            raise RuntimeError(f"Unresolvable stage dependencies: {', '.join(pending)}")
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = running.pop(future)
+            results[name], timings[name] = future.result()
+    return results, timings
+
+
+# Selain format audio, /embed dapat mengembalikan delta ringkas (StegoDelta) terhadap cover
+DELTA_FORMAT = "delta"
+EMBED_OUTPUT_FORMATS = AudioSteganography.OUTPUT_FORMATS + (DELTA_FORMAT,)
+
+
+def finish_encode_stream(stream: PCMEncodeStream, buffer: io.BytesIO) -> bytes:
+    stream.finish()
+    return buffer.getvalue()
+
+
+def embed_in_process(stego: AudioSteganography, job: Job, secret_bytes: bytes, secret_name: str,
+                     stego_key: str, n_lsb: int, use_encryption: bool, use_random: bool,
+                     use_key_check: bool) -> Optional[SharedPCM]:
+    """Embed in a PROCESS_POOL worker without pickling PCM.
+
+    The cover is placed in a shared block and the worker writes the stego PCM into
+    a second one. On success stego.audio_data becomes a view of that block, which
+    the caller must release via SHARED_PCM; on failure nothing is left allocated.
+    Cancellation is checked while waiting but cannot interrupt a running worker.
+    """
+    cover = SHARED_PCM.copy_of(stego.audio_data)
+    output = SHARED_PCM.create(cover.array.shape)
+    try:
+        job.update_progress("embed", 0, 1)
+        future = PROCESS_POOL.submit(
+            embed_shared, cover.ref, output.ref, stego.sample_rate, stego.channels,
+            secret_bytes, secret_name, stego_key, n_lsb, use_encryption, use_random,
+            use_key_check, STEGO_WORKERS)
+        while True:
+            try:
+                embed_stats = future.result(timeout=0.1)
+                break
+            except FutureTimeout:
+                if job.token.cancelled:
+                    future.cancel()
+                    job.token.raise_if_cancelled()
+    except BaseException:
+        SHARED_PCM.release(output)
+        raise
+    finally:
+        SHARED_PCM.release(cover)
+
+    if embed_stats is None:
+        SHARED_PCM.release(output)
+        return None
+    job.update_progress("embed", 1, 1)
+    stego.audio_data = output.array
+    stego.embed_stats = embed_stats
+    return output
+
+
+def eager_output_formats(formats: List[str]) -> List[str]:
+    """Formats encoded during /embed itself (delta is not an encode)."""
+    # MP3 tidak di-encode di sini; WAV stego disimpan dan MP3 dibuat saat pertama diunduh
+    eager_formats = [fmt for fmt in formats if fmt not in ("mp3", DELTA_FORMAT)]
+    if "mp3" in formats and "wav" not in eager_formats:
+        eager_formats.append("wav")
+    return eager_formats
+
+
+def embed_pipeline(stego: AudioSteganography, job: Job, secret_bytes: bytes, secret_name: str,
+                   stego_key: str, n_lsb: int, use_encryption: bool, use_random: bool,
+                   use_key_check: bool, formats: List[str]) -> Optional[Tuple[dict, Optional[Tuple[str, str]]]]:
+    """Embed and produce the requested outputs; runs in a worker thread.
+
+    Returns (response fields, artifact the response links to) or None on failure.
+    """
+    eager_formats = eager_output_formats(formats)
+    want_delta = DELTA_FORMAT in formats
+
+    shared_output = None
+    encode_streams = {}
+    try:
+        embed_start = time.perf_counter()
+        # Untuk delta, embedding mencatat sampel yang disentuh tanpa mengubah cover
+        if PROCESS_POOL is not None and not want_delta and stego.memory_profiler is None:
+            shared_output = embed_in_process(stego, job, secret_bytes, secret_name, stego_key, n_lsb,
+                                             use_encryption, use_random, use_key_check)
+            ok = shared_output is not None
+        else:
+            if not want_delta:
+                # Encoder ffmpeg (FLAC) sudah berjalan selama embedding, diisi blok yang selesai
+                for fmt in eager_formats:
+                    buffer = io.BytesIO()
+                    stream = stego.stream_encode(fmt, buffer)
+                    if stream is not None:
+                        encode_streams[fmt] = (stream, buffer)
+            ok = stego.embed_bytes(secret_bytes, secret_name, stego_key,
+                                   n_lsb=n_lsb, use_encryption=use_encryption, use_random=use_random,
+                                   use_key_check=use_key_check, copy_on_touch=want_delta)
+        timings = {"embed": time.perf_counter() - embed_start}
+        if not ok:
+            return None
+
+        response = {"output_formats": formats}
+        if want_delta:
+            delta_start = time.perf_counter()
+            delta = StegoDelta.from_embed_delta(stego.embed_delta, stego.audio_data.size)
+            delta_bytes = delta.to_bytes()
+            response["delta_file"] = encode_to_b64(delta_bytes)
+            response["delta_size"] = len(delta_bytes)
+            if eager_formats:
+                stego.audio_data = delta.apply(stego.audio_data)
+            timings["delta"] = time.perf_counter() - delta_start
+
+        # --- Post-embed stages: encode -> base64 per format, dijalankan paralel ---
+        job.update_progress("export", 0, len(eager_formats))
+        stages = {}
+        for fmt in eager_formats:
+            if fmt in encode_streams:
+                stages[f"encode_{fmt}"] = (partial(finish_encode_stream, *encode_streams[fmt]), [])
+            else:
+                stages[f"encode_{fmt}"] = (partial(stego.to_bytes, fmt), [])
+            if fmt in formats:
+                stages[f"b64_{fmt}"] = (partial(profiled_b64, stego), [f"encode_{fmt}"])
+        artifact_id = ARTIFACTS.new_key()
+        if "mp3" in formats:
+            stages["store_wav"] = (partial(ARTIFACTS.put, artifact_id, "stego.wav"), ["encode_wav"])
+            response_artifact = (artifact_id, "stego.wav")
+        else:
+            response_artifact = None
+        results, stage_timings = run_stage_graph(stages, STAGE_POOL, job.token)
+        timings.update(stage_timings)
+
+        psnr = {}
+        for fmt in formats:
+            if fmt == DELTA_FORMAT:
+                continue
+            if fmt == "mp3":
+                response["mp3_url"] = f"/download/{artifact_id}/mp3"
+                continue
+            response[f"{fmt}_file"] = results[f"b64_{fmt}"]
+            # PSNR output lossless sudah dihitung oleh kernel embedding
+            psnr[fmt] = stego.embed_stats["psnr"]
+
+        response["psnr_score"] = psnr
+        response["embed_stats"] = {key: stego.embed_stats[key]
+                                   for key in ("modified_samples", "max_deviation", "mse")}
+        response["timings"] = {name: round(seconds * 1000, 2) for name, seconds in timings.items()}
+        if stego.memory_profile is not None:
+            response["memory_profile"] = stego.memory_profile
+        return response, response_artifact
+    finally:
+        # Encoder yang tidak selesai (embedding gagal/dibatalkan) dihentikan
+        for stream, _ in encode_streams.values():
+            stream.abort()
+        # Blok stego shared memory cukup hidup sampai semua output selesai di-encode
+        SHARED_PCM.release(shared_output)
+
+
 @app.post("/embed")
 async def api_embed(
-    cover_file: UploadFile = File(...),
+    request: Request,
+    cover_file: Optional[UploadFile] = File(None),
     secret_file: UploadFile = File(...),
     stego_key: str = Form(...),
     n_lsb: int = Form(1),
     use_encryption: bool = Form(False),
-    use_random: bool = Form(False)
+    use_random: bool = Form(False),
+    output_formats: str = Form("wav"),
+    use_key_check: bool = Form(True),
+    upload_id: Optional[str] = Form(None),
+    job_id: Optional[str] = Form(None),
+    profile_memory: bool = Form(False),
+    cover_id: Optional[str] = Form(None),
 ):
-    cover_path = None
-    secret_path = None
-    wav_path = None
-    mp3_path = None
-
+    job = JOBS.create("embed", job_id, client_key(request))
+    METRICS.inc("requests_total", labels={"kind": "embed"}, help_text="Embed/extract requests handled")
+    stego = None
+    ticket = None
     try:
-        # --- Save uploads ---
-        cover_path = save_uploaded_file(cover_file, subdir="covers")
-        secret_path = save_uploaded_file(secret_file, subdir="secrets")
-
         if not stego_key or len(stego_key) < 6:
             return JSONResponse({"success": False, "error": "stego_key required (min 6 chars)"}, status_code=400)
 
         if not (1 <= n_lsb <= 4):
             return JSONResponse({"success": False, "error": "n_lsb must be 1-4"}, status_code=400)
 
-        use_encryption = parse_bool(use_encryption)
-        use_random = parse_bool(use_random)
+        formats = parse_output_formats(output_formats)
+        invalid = [fmt for fmt in formats if fmt not in EMBED_OUTPUT_FORMATS]
+        if not formats or invalid:
+            return JSONResponse(
+                {"success": False, "error": f"output_formats must be a subset of {', '.join(EMBED_OUTPUT_FORMATS)}"},
+                status_code=400,
+            )
+
+        # --- Read uploads into memory ---
+        secret_bytes = await secret_file.read()
+        use_encryption, use_random, use_key_check = (
+            parse_bool(use_encryption), parse_bool(use_random), parse_bool(use_key_check))
 
-        # --- Prepare output filenames ---
-        cover_name = os.path.splitext(os.path.basename(cover_path))[0]
-        wav_path = UPLOAD_DIR / "stego" / f"{cover_name}_stego.wav"
-        mp3_path = UPLOAD_DIR / "stego" / f"{cover_name}.mp3"
-        wav_path.parent.mkdir(parents=True, exist_ok=True)
-        mp3_path.parent.mkdir(parents=True, exist_ok=True)
+        # Request identik (cover, secret, kunci, parameter sama) dilayani dari cache
+        # Request dengan profil memori selalu dijalankan ulang agar profilnya nyata
+        cache_key = None
+        profile_memory = parse_bool(profile_memory) or PROFILE_MEMORY
+        cover_hash, cover_bytes = (None, None) if profile_memory else await cover_digest(
+            cover_file, upload_id, cover_id)
+        if cover_hash is not None:
+            cache_key = ResultCache.digest(
+                cover=cover_hash,
+                secret=hashlib.sha256(secret_bytes).hexdigest(),
+                secret_name=secret_file.filename or "secret",
+                key=hashlib.sha256(stego_key.encode("utf-8")).hexdigest(),
+                n_lsb=n_lsb, use_encryption=use_encryption, use_random=use_random,
+                use_key_check=use_key_check, output_formats=formats,
+            )
+            cached = RESULT_CACHE.get(cache_key)
+            if cached is not None:
+                METRICS.inc("result_cache_hits_total", help_text="Embed requests served from the result cache")
+                # file_name mengikuti nama upload request ini, bukan request yang mengisi cache
+                return {"success": True, "job_id": job.id, "cached": True,
+                        "file_name": cover_file_name(cover_file, upload_id, cover_id), **cached}
+
+        # Biaya diperkirakan dari ukuran cover sebelum decode; menunggu giliran bila budget penuh
+        samples, fmt, decoded = audio_source_size(cover_file, upload_id, cover_id)
+        ticket = await ADMISSION.acquire(
+            client_key(request),
+            estimate_embed_cost(samples, fmt, n_lsb, use_random, eager_output_formats(formats), decoded))
 
         # --- Load and embed ---
-        stego = AudioSteganography()
-        if not stego.load_audio(cover_path):
-            return JSONResponse({"success": False, "error": "Failed to load cover audio"}, status_code=500)
+        stego, _, error = await open_cover(
+            engine_options(job, profile_memory), cover_file, upload_id, cover_id, request, job, cover_bytes)
+        cover_bytes = None
+        if error is not None:
+            return error
 
         capacity = stego.calculate_capacity(n_lsb)
-        secret_size = os.path.getsize(secret_path)
+        secret_size = len(secret_bytes)
         if secret_size > capacity:
             return JSONResponse(
                 {"success": False, "error": "Secret too large for cover capacity", "capacity": capacity, "secret_size": secret_size},
                 status_code=400,
             )
 
-        ok = stego.embed_message(secret_path, str(mp3_path), stego_key, 
-                                 n_lsb=n_lsb, use_encryption=use_encryption, use_random=use_random)
-        if not ok:
+        # Dijalankan di thread agar disconnect klien bisa dideteksi dan membatalkan job
+        result = await run_cancellable(
+            request, job, embed_pipeline, stego, job, secret_bytes, secret_file.filename or "secret",
+            stego_key, n_lsb, use_encryption, use_random, use_key_check, formats,
+        )
+        if result is None:
             return JSONResponse({"success": False, "error": "Embedding failed"}, status_code=500)
 
-        with open(wav_path, "rb") as f:
-            wav_b64 = base64.b64encode(f.read()).decode("utf-8")
+        response, artifact = result
+        if cache_key is not None:
+            RESULT_CACHE.put(cache_key, response, artifact)
+        return {"success": True, "job_id": job.id, "cached": False,
+                "file_name": cover_file_name(cover_file, upload_id, cover_id), **response}
 
-        with open(mp3_path, "rb") as f:
-            mp3_b64 = base64.b64encode(f.read()).decode("utf-8")
+    except OperationCancelled:
+        return JSONResponse({"success": False, "error": "Job cancelled", "job_id": job.id}, status_code=499)
 
+    except Overloaded as e:
+        return overloaded_response(e)
 
-        # --- Compute PSNR and return ---
-        psnr = stego.calculate_psnr(cover_path, str(wav_path))
-        psnr_wav = stego.calculate_psnr(cover_path, str(wav_path))
-        psnr_mp3 = stego.calculate_psnr(cover_path, str(mp3_path))
-        psnr = {"wav": psnr_wav, "mp3": psnr_mp3}
+    except QuotaExceededError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=507)
 
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
 
-        return {
-            "success": True,
-            "wav_file": wav_b64,
-            "mp3_file": mp3_b64,
-            "file_name": cover_name,
-            "psnr_score": psnr
-        }
+    finally:
+        JOBS.remove(job.id)
+        if ticket is not None:
+            ADMISSION.release(ticket)
+        if stego is not None:
+            METRICS.observe_memory_profile("embed", stego.memory_profile)
+
+
+def embed_multi_pipeline(stegos: List[AudioSteganography], secret_bytes: bytes, secret_name: str,
+                         stego_key: str, n_lsb: int, use_encryption: bool, use_random: bool,
+                         use_key_check: bool) -> Optional[Tuple[str, List[str]]]:
+    """Shard the secret over all covers and encode each stego WAV; runs in a worker thread."""
+    payload_id = embed_sharded(stegos, secret_bytes, secret_name, stego_key, n_lsb,
+                               use_encryption, use_random, use_key_check)
+    if payload_id is None:
+        return None
+    wav_files = list(STAGE_POOL.map(lambda stego: encode_to_b64(stego.to_bytes("wav")), stegos))
+    return payload_id, wav_files
+
+
+@app.post("/embed/multi")
+async def api_embed_multi(
+    request: Request,
+    cover_files: Optional[List[UploadFile]] = File(None),
+    cover_ids: Optional[str] = Form(None),
+    secret_file: UploadFile = File(...),
+    stego_key: str = Form(...),
+    n_lsb: int = Form(1),
+    use_encryption: bool = Form(False),
+    use_random: bool = Form(False),
+    use_key_check: bool = Form(True),
+    job_id: Optional[str] = Form(None),
+):
+    """Spread one secret over several covers (uploaded files and/or library cover_ids)."""
+    job = JOBS.create("embed", job_id, client_key(request))
+    METRICS.inc("requests_total", labels={"kind": "embed_multi"}, help_text="Embed/extract requests handled")
+    ticket = None
+    try:
+        if not stego_key or len(stego_key) < 6:
+            return JSONResponse({"success": False, "error": "stego_key required (min 6 chars)"}, status_code=400)
+
+        if not (1 <= n_lsb <= 4):
+            return JSONResponse({"success": False, "error": "n_lsb must be 1-4"}, status_code=400)
+
+        cost = Cost(0.0, 0)
+        sources = [(None, cover_id) for cover_id in parse_csv(cover_ids)] + [(f, None) for f in cover_files or []]
+        for upload, cover_id in sources:
+            samples, fmt, decoded = audio_source_size(upload, None, cover_id)
+            cost += estimate_embed_cost(samples, fmt, n_lsb, parse_bool(use_random), ["wav"], decoded)
+        ticket = await ADMISSION.acquire(client_key(request), cost)
+
+        stegos, names = [], []
+        for cover_id in parse_csv(cover_ids):
+            stego, filename, error = await open_cover(engine_options(job), None, None, cover_id, request, job)
+            if error is not None:
+                return error
+            stegos.append(stego)
+            names.append(filename)
+        for cover_file in cover_files or []:
+            stego, filename, error = await open_cover(engine_options(job), cover_file, None, None, request, job)
+            if error is not None:
+                return error
+            stegos.append(stego)
+            names.append(filename)
+        if not stegos:
+            return JSONResponse({"success": False, "error": "cover_files or cover_ids required"}, status_code=400)
+
+        secret_bytes = await secret_file.read()
+        result = await run_cancellable(
+            request, job, embed_multi_pipeline, stegos, secret_bytes, secret_file.filename or "secret",
+            stego_key, n_lsb, parse_bool(use_encryption), parse_bool(use_random), parse_bool(use_key_check),
+        )
+        if result is None:
+            capacity = sum(stego.calculate_capacity(n_lsb) for stego in stegos)
+            return JSONResponse(
+                {"success": False, "error": "Embedding failed (secret may exceed combined capacity)",
+                 "capacity": capacity, "secret_size": len(secret_bytes)},
+                status_code=400,
+            )
+
+        payload_id, wav_files = result
+        shards = [
+            {
+                "seq": seq,
+                "file_name": os.path.splitext(os.path.basename(name or "cover"))[0],
+                "wav_file": wav_file,
+                "psnr_score": stego.embed_stats["psnr"],
+            }
+            for seq, (stego, name, wav_file) in enumerate(zip(stegos, names, wav_files))
+        ]
+        return {"success": True, "job_id": job.id, "payload_id": payload_id, "shards": shards}
+
+    except OperationCancelled:
+        return JSONResponse({"success": False, "error": "Job cancelled", "job_id": job.id}, status_code=499)
+
+    except Overloaded as e:
+        return overloaded_response(e)
 
     except Exception as e:
         import traceback
@@ -138,40 +801,425 @@ async def api_embed(
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
 
     finally:
-        # --- Cleanup temp files ---
-        for path in [cover_path, secret_path, wav_path, mp3_path]:
-            if path and os.path.exists(path):
-                try:
-                    os.remove(path)
-                except Exception as cleanup_err:
-                    print(f"Warning: could not delete {path}: {cleanup_err}")
+        JOBS.remove(job.id)
+        if ticket is not None:
+            ADMISSION.release(ticket)
+
+
+@app.get("/ready")
+def api_ready():
+    body = {"success": STARTUP["ready"], **STARTUP,
+            "import_budget_ms": IMPORT_TIME_BUDGET_MS, "first_request_budget_ms": FIRST_REQUEST_BUDGET_MS}
+    return JSONResponse(body, status_code=200 if STARTUP["ready"] else 503)
+
+
+@app.get("/metrics")
+def api_metrics():
+    for name in ("import_ms", "warmup_ms", "first_request_ms"):
+        if STARTUP[name] is not None:
+            METRICS.set(f"startup_{name.replace('_ms', '_seconds')}", STARTUP[name] / 1000,
+                        help_text="Startup timings")
+    METRICS.set("ready", int(STARTUP["ready"]), help_text="1 once warmup has finished")
+    shared = SHARED_PCM.stats()
+    METRICS.set("shared_memory_blocks", shared["blocks"], help_text="Live shared-memory PCM blocks")
+    METRICS.set("shared_memory_bytes", shared["bytes"], help_text="Bytes held in shared-memory PCM blocks")
+    for name, value in ADMISSION.stats().items():
+        METRICS.set(f"admission_{name}", value, help_text="Admission control state")
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/covers")
+async def api_register_cover(
+    request: Request,
+    cover_file: Optional[UploadFile] = File(None),
+    upload_id: Optional[str] = Form(None),
+):
+    ticket = None
+    try:
+        samples, fmt, _ = audio_source_size(cover_file, upload_id)
+        ticket = await ADMISSION.acquire(client_key(request), estimate_decode_cost(samples, fmt))
+
+        if upload_id:
+            try:
+                f, upload_meta = UPLOADS.open(upload_id)
+            except KeyError:
+                return JSONResponse({"success": False, "error": "Unknown or unfinished upload_id"}, status_code=404)
+            filename = upload_meta["filename"]
+            with f:
+                meta = await run_in_threadpool(COVERS.register, f, filename,
+                                               os.path.splitext(filename)[1].lstrip(".") or None)
+        elif cover_file is not None:
+            meta = await run_in_threadpool(COVERS.register, await cover_file.read(),
+                                           cover_file.filename or "", upload_format(cover_file) or None)
+        else:
+            return JSONResponse({"success": False, "error": "cover_file or upload_id required"}, status_code=400)
+
+        if meta is None:
+            return JSONResponse({"success": False, "error": "Failed to load cover audio"}, status_code=400)
+        return {"success": True, **meta}
+
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    except QuotaExceededError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=507)
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+
+    finally:
+        if ticket is not None:
+            ADMISSION.release(ticket)
+
+
+@app.get("/covers")
+def api_list_covers():
+    return {"success": True, "covers": COVERS.list()}
+
+
+@app.get("/covers/{cover_id}")
+def api_get_cover(cover_id: str):
+    meta = COVERS.get(cover_id)
+    if meta is None:
+        return JSONResponse({"success": False, "error": "Unknown cover_id"}, status_code=404)
+    return {"success": True, **meta}
+
+
+@app.delete("/covers/{cover_id}")
+def api_delete_cover(cover_id: str):
+    if not COVERS.delete(cover_id):
+        return JSONResponse({"success": False, "error": "Unknown cover_id"}, status_code=404)
+    return {"success": True}
+
+
+# Job hanya terlihat dan bisa dibatalkan oleh klien yang memulainya
+@app.get("/jobs")
+def api_list_jobs(request: Request):
+    return {"success": True, "jobs": JOBS.list(client_key(request))}
+
+
+@app.get("/jobs/{job_id}")
+def api_get_job(request: Request, job_id: str):
+    job = JOBS.get(job_id, client_key(request))
+    if job is None:
+        return JSONResponse({"success": False, "error": "Unknown job"}, status_code=404)
+    return {"success": True, **job.to_dict()}
+
+
+@app.delete("/jobs/{job_id}")
+def api_cancel_job(request: Request, job_id: str):
+    if not JOBS.cancel(job_id, client_key(request)):
+        return JSONResponse({"success": False, "error": "Unknown job"}, status_code=404)
+    return {"success": True, "job_id": job_id, "cancelled": True}
+
+
+@app.post("/uploads")
+def api_create_upload(total_size: int = Form(...), filename: str = Form("")):
+    try:
+        return {"success": True, **UPLOADS.create(total_size, filename)}
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    except QuotaExceededError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=507)
+
+
+@app.get("/uploads/{upload_id}")
+def api_get_upload(upload_id: str):
+    meta = UPLOADS.get(upload_id)
+    if meta is None:
+        return JSONResponse({"success": False, "error": "Unknown upload_id"}, status_code=404)
+    received = sum(end - start for start, end in meta["ranges"])
+    return {"success": True, "received_bytes": received, **meta}
+
+
+@app.put("/uploads/{upload_id}/chunks/{index}")
+async def api_put_chunk(upload_id: str, index: int, request: Request, offset: int):
+    # index hanya penanda dari klien; posisi data ditentukan oleh offset
+    try:
+        meta = await UPLOADS.write_chunk(upload_id, offset, request.stream())
+    except KeyError:
+        return JSONResponse({"success": False, "error": "Unknown upload_id"}, status_code=404)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    return {"success": True, "index": index, "ranges": meta["ranges"]}
+
+
+@app.post("/uploads/{upload_id}/finalize")
+def api_finalize_upload(upload_id: str, sha256: Optional[str] = Form(None)):
+    try:
+        meta = UPLOADS.finalize(upload_id, sha256)
+    except KeyError:
+        return JSONResponse({"success": False, "error": "Unknown upload_id"}, status_code=404)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e), **(UPLOADS.get(upload_id) or {})}, status_code=409)
+    return {"success": True, **meta}
+
+
+@app.delete("/uploads/{upload_id}")
+def api_delete_upload(upload_id: str):
+    if UPLOADS.get(upload_id) is None:
+        return JSONResponse({"success": False, "error": "Unknown upload_id"}, status_code=404)
+    UPLOADS.delete(upload_id)
+    return {"success": True}
+
+
+@app.post("/plan")
+async def api_plan(
+    request: Request,
+    cover_file: Optional[UploadFile] = File(None),
+    secret_file: Optional[UploadFile] = File(None),
+    secret_size: Optional[int] = Form(None),
+    secret_name: str = Form("secret"),
+    psnr_floor: float = Form(40.0),
+    use_encryption: bool = Form(False),
+    use_random: Optional[str] = Form(None),
+    use_key_check: bool = Form(True),
+    upload_id: Optional[str] = Form(None),
+    cover_id: Optional[str] = Form(None),
+):
+    ticket = None
+    try:
+        if secret_file is not None:
+            secret_size = len(await secret_file.read())
+            secret_name = secret_file.filename or secret_name
+        if secret_size is None or secret_size < 0:
+            return JSONResponse({"success": False, "error": "secret_file or secret_size required"}, status_code=400)
+
+        # Decode dan histogram LSB seluruh cover: ikut antrean seperti embed/extract
+        samples, fmt, decoded = audio_source_size(cover_file, upload_id, cover_id)
+        ticket = await ADMISSION.acquire(client_key(request), estimate_plan_cost(samples, fmt, decoded))
+
+        stego, _, error = await open_cover(engine_options(), cover_file, upload_id, cover_id)
+        if error is not None:
+            return error
+
+        # use_random kosong: pertimbangkan mode berurutan dan acak
+        mode = None if use_random in (None, "") else parse_bool(use_random)
+        plan = await run_in_threadpool(stego.plan, secret_size, psnr_floor, secret_name=secret_name,
+                                       use_encryption=parse_bool(use_encryption), use_random=mode,
+                                       use_key_check=parse_bool(use_key_check))
+        return {"success": True, "secret_size": secret_size, "psnr_floor": psnr_floor, **plan}
+
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+
+    finally:
+        if ticket is not None:
+            ADMISSION.release(ticket)
+
+
+def encode_artifact(artifact_id: str, fmt: str) -> Optional[Path]:
+    """Encode the stored stego WAV of an artifact to fmt once; None if the artifact is gone."""
+    # Lock per artefak agar MP3 lazy hanya di-encode sekali walau diunduh bersamaan
+    with ARTIFACTS.key_lock(artifact_id):
+        out_path = ARTIFACTS.get(artifact_id, f"stego.{fmt}")
+        if out_path is not None:
+            return out_path
+        wav_path = ARTIFACTS.get(artifact_id, "stego.wav")
+        if wav_path is None:
+            return None
+        stego = new_engine()
+        if not stego.load_audio(str(wav_path)):
+            raise IOError("Encoding failed")
+        return ARTIFACTS.put(artifact_id, f"stego.{fmt}", stego.to_bytes(fmt))
+
+
+@app.get("/download/{artifact_id}/{fmt}")
+async def api_download(request: Request, artifact_id: str, fmt: str):
+    if fmt != "mp3":
+        return JSONResponse({"success": False, "error": "Unknown artifact"}, status_code=404)
+
+    ticket = None
+    try:
+        out_path = ARTIFACTS.get(artifact_id, f"stego.{fmt}")
+        if out_path is None:
+            wav_path = ARTIFACTS.get(artifact_id, "stego.wav")
+            if wav_path is None:
+                return JSONResponse({"success": False, "error": "Unknown artifact"}, status_code=404)
+            if ffmpeg_tools() is None:
+                return JSONResponse({"success": False, "error": f"{fmt} encoding unavailable: ffmpeg not found"},
+                                    status_code=503)
+            # Encode MP3 hanya sekali, pada unduhan pertama; biayanya ditanggung unduhan ini, bukan /embed
+            samples = estimate_samples(wav_path.stat().st_size, "wav")
+            ticket = await ADMISSION.acquire(client_key(request), estimate_encode_cost(samples, fmt))
+            out_path = await run_in_threadpool(encode_artifact, artifact_id, fmt)
+            if out_path is None:
+                return JSONResponse({"success": False, "error": "Unknown artifact"}, status_code=404)
+
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    except QuotaExceededError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=507)
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+
+    finally:
+        if ticket is not None:
+            ADMISSION.release(ticket)
+
+    return FileResponse(out_path, media_type="audio/mpeg", filename=f"{artifact_id}_stego.{fmt}")
+
+
+def content_disposition(filename: str) -> str:
+    ascii_name = filename.encode("ascii", "ignore").decode("ascii").replace('"', "") or "file_terekstrak"
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def finish_job(job: Job, ticket=None) -> None:
+    """Unregister a job and return its admission ticket; safe to call more than once."""
+    JOBS.remove(job.id)
+    if ticket is not None:
+        ADMISSION.release(ticket)
+
+
+def iter_job(chunks: Iterator[bytes], job: Job,
+             stego: Optional[AudioSteganography] = None, ticket=None) -> Iterator[bytes]:
+    """Yield chunks, unregistering the job (and its admission ticket) once streaming ends or is aborted."""
+    try:
+        yield from chunks
+    except OperationCancelled:
+        print(f"Job {job.id} cancelled during streaming")
+    finally:
+        finish_job(job, ticket)
+        if stego is not None:
+            METRICS.observe_memory_profile("extract", stego.memory_profile)
+
+
 @app.post("/extract")
 async def api_extract(
-    stego_file: UploadFile = File(...),
+    request: Request,
+    stego_file: Optional[UploadFile] = File(None),
     stego_key: str = Form(...),
+    upload_id: Optional[str] = Form(None),
+    job_id: Optional[str] = Form(None),
+    profile_memory: bool = Form(False),
 ):
+    job = JOBS.create("extract", job_id, client_key(request))
+    METRICS.inc("requests_total", labels={"kind": "extract"}, help_text="Embed/extract requests handled")
+    streaming = False
+    ticket = None
     try:
-        stego_path = save_uploaded_file(stego_file, subdir="stego_uploads")
-
         if not stego_key:
             return JSONResponse({"success": False, "error": "stego_key is required"}, status_code=400)
 
-        stego = AudioSteganography()
-        if not stego.load_audio(stego_path):
-            return JSONResponse({"success": False, "error": "Failed to load stego audio"}, status_code=500)
+        samples, fmt, _ = audio_source_size(stego_file, upload_id)
+        ticket = await ADMISSION.acquire(client_key(request), estimate_extract_cost(samples, fmt))
 
-        out_path = stego.extract_message(stego_key)
-        if not out_path:
+        stego = new_engine(job, parse_bool(profile_memory))
+        _, error = await load_audio_source(stego, stego_file, upload_id, "stego", request, job)
+        if error is not None:
+            return error
+
+        # Header dibaca sekarang; data rahasia diekstrak per potongan saat dikirim
+        header = await run_cancellable(request, job, stego.read_header)
+        if header is None:
             return JSONResponse({"success": False, "error": "Extraction failed"}, status_code=400)
+        metadata, data_start_sample = header
+
+        # Kunci salah ditolak dari header saja, sebelum permutasi/ekstraksi payload
+        if not stego.verify_key(metadata, stego_key):
+            return JSONResponse({"success": False, "error": "Invalid stego key"}, status_code=403)
+        # Disconnect klien menghentikan iterasi; DELETE /jobs/{id} membatalkan antar potongan
+        chunks = iter_job(stego.iter_secret(metadata, data_start_sample, stego_key), job, stego, ticket)
+
+        original_name, _ = os.path.splitext(metadata.get("original_name", "file_terekstrak"))
+        out_name = os.path.basename(f"{original_name}{metadata.get('extension', '')}")
+        headers = {
+            "Content-Disposition": content_disposition(out_name),
+            "Content-Length": str(metadata["file_size"]),
+            "X-Job-Id": job.id,
+        }
+        streaming = True
+        # finish_job() is idempotent: also covers a stream that is never started
+        return StreamingResponse(chunks, media_type="application/octet-stream", headers=headers,
+                                 background=BackgroundTask(finish_job, job, ticket))
+
+    except OperationCancelled:
+        return JSONResponse({"success": False, "error": "Job cancelled", "job_id": job.id}, status_code=499)
+
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
 
-        rel_path = os.path.relpath(out_path, start=BASE_DIR)
-        return {"success": True, "file": rel_path, "original_name": os.path.basename(rel_path)}
+    finally:
+        if not streaming:
+            finish_job(job, ticket)
+
+
+@app.post("/extract/multi")
+async def api_extract_multi(
+    request: Request,
+    stego_files: List[UploadFile] = File(...),
+    stego_key: str = Form(...),
+    job_id: Optional[str] = Form(None),
+):
+    """Reassemble a payload from all of its stego files, uploaded in any order."""
+    job = JOBS.create("extract", job_id, client_key(request))
+    METRICS.inc("requests_total", labels={"kind": "extract_multi"}, help_text="Embed/extract requests handled")
+    ticket = None
+    try:
+        cost = Cost(0.0, 0)
+        for stego_file in stego_files:
+            samples, fmt, _ = audio_source_size(stego_file, None)
+            cost += estimate_extract_cost(samples, fmt)
+        ticket = await ADMISSION.acquire(client_key(request), cost)
+
+        stegos = []
+        for stego_file in stego_files:
+            stego = new_engine(job)
+            _, error = await load_audio_source(stego, stego_file, None, "stego", request, job)
+            if error is not None:
+                return error
+            stegos.append(stego)
+
+        result = await run_cancellable(request, job, extract_sharded, stegos, stego_key)
+        if result is None:
+            return JSONResponse({"success": False, "error": "Extraction failed (wrong key or incomplete shard set)"},
+                                status_code=400)
+        secret_data, metadata = result
+
+        original_name, _ = os.path.splitext(metadata.get("original_name", "file_terekstrak"))
+        out_name = os.path.basename(f"{original_name}{metadata.get('extension', '')}")
+        return Response(secret_data, media_type="application/octet-stream",
+                        headers={"Content-Disposition": content_disposition(out_name), "X-Job-Id": job.id})
+
+    except OperationCancelled:
+        return JSONResponse({"success": False, "error": "Job cancelled", "job_id": job.id}, status_code=499)
+
+    except Overloaded as e:
+        return overloaded_response(e)
 
     except Exception as e:
         import traceback
         traceback.print_exc()
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
 
+    finally:
+        JOBS.remove(job.id)
+        if ticket is not None:
+            ADMISSION.release(ticket)
+
+
+STARTUP["import_ms"] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 2)
+if STARTUP["import_ms"] > IMPORT_TIME_BUDGET_MS:
+    print(f"⚠ Import main.py {STARTUP['import_ms']} ms melebihi budget {IMPORT_TIME_BUDGET_MS} ms")
+
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
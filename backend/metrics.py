@@ -0,0 +1,60 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+from script import current_rss
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """Minimal in-process metrics registry rendered in Prometheus text format."""
+
+    def __init__(self, prefix: str = "stego"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[Labels, float]] = {}
+        self._types: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+
+    def _update(self, name: str, kind: str, help_text: str, labels: Optional[dict], fn) -> None:
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            self._types.setdefault(name, kind)
+            self._help.setdefault(name, help_text)
+            series = self._values.setdefault(name, {})
+            series[key] = fn(series.get(key))
+
+    def inc(self, name: str, amount: float = 1, labels: Optional[dict] = None, help_text: str = "") -> None:
+        self._update(name, "counter", help_text, labels, lambda old: (old or 0) + amount)
+
+    def set(self, name: str, value: float, labels: Optional[dict] = None, help_text: str = "") -> None:
+        self._update(name, "gauge", help_text, labels, lambda old: value)
+
+    def max(self, name: str, value: float, labels: Optional[dict] = None, help_text: str = "") -> None:
+        self._update(name, "gauge", help_text, labels, lambda old: value if old is None else max(old, value))
+
+    def observe_memory_profile(self, kind: str, stages: Optional[dict]) -> None:
+        """Fold a MemoryProfiler result (per-stage dict) into the registry."""
+        for stage, entry in (stages or {}).items():
+            labels = {"kind": kind, "stage": stage}
+            self.inc("stage_calls_total", entry["calls"], labels, "Profiled stage invocations")
+            self.inc("stage_seconds_total", entry["seconds"], labels, "Wall-clock seconds spent in stage")
+            self.max("stage_tracemalloc_peak_bytes", entry["tracemalloc_peak_bytes"], labels,
+                     "Highest Python allocation peak observed during stage")
+            self.max("stage_rss_delta_bytes", entry["rss_delta_bytes"], labels,
+                     "Largest RSS growth observed during stage")
+
+    def render(self) -> str:
+        self.set("process_rss_bytes", current_rss(), help_text="Resident set size of the API process")
+        lines = []
+        with self._lock:
+            for name in sorted(self._values):
+                full = f"{self.prefix}_{name}"
+                if self._help[name]:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} {self._types[name]}")
+                for labels, value in sorted(self._values[name].items()):
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                    sample = f"{full}{{{label_text}}}" if label_text else full
+                    lines.append(f"{sample} {float(value)!r}")
+        return "\n".join(lines) + "\n"
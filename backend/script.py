@@ -1,14 +1,35 @@
+import io
 import os
 from pathlib import Path
 import sys
 import struct
+import zlib
 import random
 import hashlib
+import hmac
 import json
 import time
-from typing import Optional, Tuple, List
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Optional, Tuple, List, Dict, Union, BinaryIO, Iterator, Callable
 import numpy as np
-from pydub import AudioSegment
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+
+
+def _audio_segment():
+    """pydub.AudioSegment, diimpor saat pertama dipakai.
+
+    Import pydub langsung mencari ffmpeg di PATH, jadi ditunda agar import
+    modul ini (dan startup API) tetap cepat.
+    """
+    from pydub import AudioSegment
+    return AudioSegment
 
 
 class VigenereCipher:
@@ -17,42 +38,36 @@ class VigenereCipher:
     def __init__(self, key: str):
         self.key = key
         
-    def _extend_key(self, text_length: int) -> bytes:
-        """Memperpanjang kunci sesuai panjang teks"""
+    def _extend_key(self, text_length: int, offset: int = 0) -> np.ndarray:
+        """Memperpanjang kunci sesuai panjang teks, mulai dari posisi offset"""
         if not self.key:
             raise ValueError("Kunci tidak boleh kosong")
         
-        key_bytes = self.key.encode('utf-8', errors='ignore')
-        extended = (key_bytes * (text_length // len(key_bytes) + 1))[:text_length]
-        return extended
+        key_bytes = np.frombuffer(self.key.encode('utf-8', errors='ignore'), dtype=np.uint8)
+        start = offset % len(key_bytes)
+        repeats = (start + text_length) // len(key_bytes) + 1
+        return np.tile(key_bytes, repeats)[start:start + text_length]
     
-    def encrypt(self, data: bytes) -> bytes:
-        """Enkripsi data menggunakan extended Vigenère cipher"""
+    def encrypt(self, data: bytes, offset: int = 0) -> bytes:
+        """Enkripsi data menggunakan extended Vigenère cipher
+
+        offset adalah posisi byte pertama data di dalam pesan utuh, sehingga pesan
+        dapat dienkripsi per potongan.
+        """
         if not data:
             return b''
         
-        key_extended = self._extend_key(len(data))
-        encrypted = bytearray()
-        
-        for i in range(len(data)):
-            encrypted_byte = (data[i] + key_extended[i]) % 256
-            encrypted.append(encrypted_byte)
-        
-        return bytes(encrypted)
+        key_extended = self._extend_key(len(data), offset)
+        # Aritmetika uint8 otomatis modulo 256
+        return (np.frombuffer(data, dtype=np.uint8) + key_extended).tobytes()
     
-    def decrypt(self, encrypted_data: bytes) -> bytes:
-        """Dekripsi data menggunakan extended Vigenère cipher"""
+    def decrypt(self, encrypted_data: bytes, offset: int = 0) -> bytes:
+        """Dekripsi data menggunakan extended Vigenère cipher (lihat encrypt untuk offset)"""
         if not encrypted_data:
             return b''
         
-        key_extended = self._extend_key(len(encrypted_data))
-        decrypted = bytearray()
-        
-        for i in range(len(encrypted_data)):
-            decrypted_byte = (encrypted_data[i] - key_extended[i]) % 256
-            decrypted.append(decrypted_byte)
-        
-        return bytes(decrypted)
+        key_extended = self._extend_key(len(encrypted_data), offset)
+        return (np.frombuffer(encrypted_data, dtype=np.uint8) - key_extended).tobytes()
 
 
 class RandomPositionGenerator:
@@ -80,43 +95,707 @@ class RandomPositionGenerator:
         return self._positions[:count]
 
 
+class OperationCancelled(Exception):
+    """Dilempar saat embedding/ekstraksi dibatalkan lewat CancellationToken"""
+
+
+class CancellationToken:
+    """Token pembatalan kooperatif yang dicek engine di antara blok"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise OperationCancelled("Operasi dibatalkan")
+
+
+def current_rss() -> int:
+    """RSS proses saat ini dalam bytes (Linux /proc; fallback ke peak RSS)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss: KB di Linux, bytes di macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class MemoryProfiler:
+    """Catat puncak alokasi (tracemalloc) dan delta RSS per tahap.
+
+    tracemalloc bersifat global per proses: jika beberapa tahap/request berjalan
+    bersamaan, puncak yang tercatat adalah puncak proses selama tahap tersebut.
+    """
+
+    def __init__(self, log: bool = True):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.log = log
+        self._lock = threading.Lock()
+
+    # Jumlah tahap aktif di seluruh proses; tracemalloc dimatikan lagi saat 0
+    # karena memperlambat setiap alokasi Python
+    _active = 0
+    _active_lock = threading.Lock()
+    _started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str):
+        with MemoryProfiler._active_lock:
+            if MemoryProfiler._active == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                MemoryProfiler._started_tracing = True
+            MemoryProfiler._active += 1
+        tracemalloc.reset_peak()
+        rss_before = current_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            rss_after = current_rss()
+            with MemoryProfiler._active_lock:
+                MemoryProfiler._active -= 1
+                if MemoryProfiler._active == 0 and MemoryProfiler._started_tracing:
+                    tracemalloc.stop()
+                    MemoryProfiler._started_tracing = False
+            self._record(name, peak, rss_after - rss_before, rss_after, time.perf_counter() - start)
+
+    def _record(self, name: str, peak: int, rss_delta: int, rss: int, seconds: float) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(name, {
+                'calls': 0, 'tracemalloc_peak_bytes': 0, 'rss_delta_bytes': 0,
+                'rss_bytes': 0, 'seconds': 0.0,
+            })
+            # Tahap yang dipanggil berulang (mis. per potongan) digabung
+            entry['calls'] += 1
+            entry['tracemalloc_peak_bytes'] = max(entry['tracemalloc_peak_bytes'], peak)
+            entry['rss_delta_bytes'] += rss_delta
+            entry['rss_bytes'] = rss
+            entry['seconds'] += seconds
+        if self.log:
+            print(f"[mem] {name}: peak={peak / 2**20:.1f} MiB, "
+                  f"rss_delta={rss_delta / 2**20:+.1f} MiB, rss={rss / 2**20:.1f} MiB")
+
+
+def profiled_stage(name: str):
+    """Decorator: profil method AudioSteganography sebagai tahap name (jika aktif)"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self._stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def read_wav_layout(file_path: str) -> Optional[Dict[str, int]]:
+    """Baca struktur RIFF/WAVE: offset & ukuran chunk data serta format sampel.
+
+    None jika file bukan WAV yang valid.
+    """
+    with open(file_path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            return None
+        layout = {}
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id, chunk_size = chunk_header[:4], struct.unpack('<I', chunk_header[4:])[0]
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                (layout['format_tag'], layout['channels'], layout['sample_rate'], _,
+                 _, layout['bits_per_sample']) = struct.unpack('<HHIIHH', fmt[:16])
+                if chunk_size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if 'format_tag' not in layout:
+                    return None
+                layout['data_offset'] = f.tell()
+                layout['data_size'] = chunk_size
+                return layout
+            else:
+                # Chunk lain (LIST, fact, ...) dilewati; ukuran ganjil dipad 1 byte
+                f.seek(chunk_size + (chunk_size % 2), os.SEEK_CUR)
+
+
+def clone_file(src: str, dst: str) -> str:
+    """Salin file dengan cara termurah yang tersedia; mengembalikan metode yang dipakai.
+
+    Urutan: reflink (FICLONE, berbagi blok di Btrfs/XFS), copy_file_range
+    (salinan di kernel), lalu shutil.copyfile.
+    """
+    import shutil
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            import fcntl
+            FICLONE = 0x40049409
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return 'reflink'
+        except (ImportError, OSError):
+            pass
+
+        if hasattr(os, 'copy_file_range'):
+            try:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return 'copy_file_range'
+            except OSError:
+                pass
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+
+        shutil.copyfileobj(fsrc, fdst, 1 << 20)
+        return 'copy'
+
+
+# Format input yang dikenali ffmpeg dengan nama demuxer yang sama (lainnya auto-detect)
+FFMPEG_DEMUXERS = ('mp3', 'flac', 'ogg')
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_tools() -> Optional[Tuple[str, str]]:
+    """Path (ffmpeg, ffprobe) dari PATH, atau None jika salah satunya tidak ada"""
+    import shutil
+    ffmpeg, ffprobe = shutil.which('ffmpeg'), shutil.which('ffprobe')
+    return (ffmpeg, ffprobe) if ffmpeg and ffprobe else None
+
+
+def _feed_stdin(proc, source: Union[bytes, BinaryIO]) -> threading.Thread:
+    """Tulis source ke stdin proses dari thread terpisah (agar stdout bisa dibaca bersamaan)"""
+    def pump():
+        try:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                proc.stdin.write(source)
+            else:
+                for block in iter(lambda: source.read(1 << 20), b''):
+                    proc.stdin.write(block)
+        except (BrokenPipeError, ValueError):
+            pass  # Proses berhenti membaca lebih awal (mis. ffprobe cukup dari header)
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    thread = threading.Thread(target=pump, daemon=True)
+    thread.start()
+    return thread
+
+
+class _PipeDrain:
+    """Baca pipe (stderr) sampai EOF di thread terpisah.
+
+    Tanpa ini ffmpeg bisa terblokir menulis error per frame begitu buffer pipe
+    (~64KB) penuh, sementara pemanggil masih menunggu stdout. Hanya `limit`
+    byte pertama yang disimpan untuk pesan error.
+    """
+
+    def __init__(self, pipe, limit: int = 1 << 16):
+        self._pipe = pipe
+        self._limit = limit
+        self._chunks: List[bytes] = []
+        self._size = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            for block in iter(lambda: self._pipe.read(1 << 16), b''):
+                if self._size < self._limit:
+                    block = block[:self._limit - self._size]
+                    self._chunks.append(block)
+                    self._size += len(block)
+        except (OSError, ValueError):
+            pass
+
+    def text(self) -> str:
+        """Isi yang terbaca (tunggu sampai pipe ditutup proses)"""
+        self._thread.join()
+        return b''.join(self._chunks).decode(errors='replace').strip()
+
+
+def _run_with_input(cmd: List[str], source: Union[str, bytes, BinaryIO], output_args: List[str] = (),
+                     **popen_kwargs):
+    """Jalankan cmd + input + output_args; input berupa path dipakai langsung,
+    selain itu dialirkan lewat stdin"""
+    import subprocess
+    from_pipe = not isinstance(source, str)
+    proc = subprocess.Popen(cmd + [source if not from_pipe else 'pipe:0'] + list(output_args),
+                            stdin=subprocess.PIPE if from_pipe else subprocess.DEVNULL,
+                            **popen_kwargs)
+    feeder = _feed_stdin(proc, source) if from_pipe else None
+    return proc, feeder
+
+
+def ffprobe_audio(source: Union[str, bytes, BinaryIO], format: Optional[str] = None) -> Dict:
+    """sample_rate, channels dan perkiraan durasi (detik, 0 jika tidak diketahui) stream audio pertama"""
+    import subprocess
+    _, ffprobe = ffmpeg_tools()
+    cmd = [ffprobe, '-v', 'error', '-select_streams', 'a:0',
+           '-show_entries', 'stream=sample_rate,channels,duration:format=duration', '-of', 'json']
+    if format in FFMPEG_DEMUXERS:
+        cmd += ['-f', format]
+    proc, feeder = _run_with_input(cmd, source, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = _PipeDrain(proc.stderr)
+    # stdin ditutup oleh thread feeder, jadi output dibaca langsung (bukan communicate)
+    out = proc.stdout.read()
+    proc.wait()
+    err = stderr.text()
+    if feeder is not None:
+        feeder.join()
+    try:
+        info = json.loads(out or b'{}')
+    except ValueError:
+        info = {}
+    if proc.returncode != 0 or not info.get('streams'):
+        raise RuntimeError(f"ffprobe gagal: {err or 'tidak ada stream audio'}")
+
+    stream = info['streams'][0]
+    duration = 0.0
+    for value in (stream.get('duration'), info.get('format', {}).get('duration')):
+        try:
+            duration = float(value)
+            break
+        except (TypeError, ValueError):
+            continue
+    return {'sample_rate': int(stream['sample_rate']), 'channels': int(stream['channels']),
+            'duration': duration}
+
+
+def ffmpeg_decode(source: Union[str, bytes, BinaryIO], format: Optional[str] = None,
+                  cancel_token: Optional["CancellationToken"] = None) -> Tuple[np.ndarray, int, int]:
+    """Decode audio lewat pipe ffmpeg (PCM s16le) langsung ke buffer NumPy.
+
+    Buffer dialokasikan sekali dari durasi hasil ffprobe dan diisi dengan
+    readinto, tanpa file WAV sementara maupun salinan bytes/array perantara.
+    Pembatalan dicek setiap potongan yang dibaca (ffmpeg dihentikan).
+    Mengembalikan (sampel int16 datar, sample_rate, channels).
+    """
+    import subprocess
+    if isinstance(source, (bytearray, memoryview)):
+        source = bytes(source)
+    start = None
+    if not isinstance(source, (str, bytes)):
+        try:
+            start = source.tell()
+        except (AttributeError, OSError):
+            source = source.read()  # Tidak bisa di-seek: baca sekali untuk ffprobe dan ffmpeg
+
+    info = ffprobe_audio(source, format)
+    if start is not None:
+        source.seek(start)
+    sample_rate, channels = info['sample_rate'], info['channels']
+
+    ffmpeg, _ = ffmpeg_tools()
+    cmd = [ffmpeg, '-hide_banner', '-v', 'error']
+    if format in FFMPEG_DEMUXERS:
+        cmd += ['-f', format]
+    proc, feeder = _run_with_input(cmd + ['-i'], source,
+                                   ['-map', '0:a:0', '-f', 's16le', '-acodec', 'pcm_s16le', 'pipe:1'],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+    stderr = _PipeDrain(proc.stderr)
+    try:
+        # Durasi dari ffprobe (+1 detik cadangan); diperbesar bila ternyata kurang
+        samples = max(1, int(info['duration'] * sample_rate) + sample_rate) * channels
+        buffer = np.empty(samples, dtype='<i2')
+        view = memoryview(buffer).cast('B')
+        filled = 0
+        while True:
+            if filled == len(view):
+                view.release()
+                buffer.resize(buffer.size + buffer.size // 2 + sample_rate * channels, refcheck=False)
+                view = memoryview(buffer).cast('B')
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            n = proc.stdout.readinto(view[filled:])
+            if not n:
+                break
+            filled += n
+        view.release()
+        proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        if feeder is not None:
+            feeder.join()
+    err = stderr.text()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg gagal decode: {err}")
+
+    frames = filled // (2 * channels)
+    # Kecilkan ke ukuran sebenarnya (realloc di tempat, bukan salinan baru)
+    buffer.resize(frames * channels, refcheck=False)
+    return buffer, sample_rate, channels
+
+
+# Argumen encoder ffmpeg per format output (WAV tetap ditulis langsung tanpa ffmpeg)
+FFMPEG_ENCODERS = {
+    'mp3': ['-f', 'mp3', '-codec:a', 'libmp3lame'],
+    'flac': ['-f', 'flac', '-codec:a', 'flac'],
+}
+
+
+class PCMEncodeStream:
+    """Encoder ffmpeg yang menerima PCM s16le lewat stdin dan menulis hasilnya ke file/stream.
+
+    Sampel dikirim dari memoryview array (tanpa salinan) oleh thread penulis,
+    hanya sampai batas advance(n). Dengan begitu encoding bisa berjalan sambil
+    sampel berikutnya masih disisipkan; finish() mengirim sisanya lalu menunggu ffmpeg.
+    """
+
+    def __init__(self, format_name: str, sample_rate: int, channels: int,
+                 destination: Union[str, BinaryIO], bitrate: Optional[str] = None):
+        import subprocess
+        ffmpeg, _ = ffmpeg_tools()
+        cmd = [ffmpeg, '-hide_banner', '-v', 'error', '-f', 's16le', '-ar', str(sample_rate),
+               '-ac', str(channels), '-i', 'pipe:0'] + FFMPEG_ENCODERS[format_name]
+        if bitrate:
+            cmd += ['-b:a', bitrate]
+        to_file = isinstance(destination, str)
+        cmd += ['-y', destination] if to_file else ['pipe:1']
+        self.format_name = format_name
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                     stdout=subprocess.DEVNULL if to_file else subprocess.PIPE,
+                                     stderr=subprocess.PIPE, bufsize=0)
+        self._stderr = _PipeDrain(self.proc.stderr)
+        self._cond = threading.Condition()
+        self._pcm: Optional[memoryview] = None
+        self._limit = 0  # Byte PCM yang sudah final dan boleh dikirim
+        self._closing = False
+        self._error: Optional[Exception] = None
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        self._reader = None
+        if not to_file:
+            self._reader = threading.Thread(target=self._read_loop, args=(destination,), daemon=True)
+            self._reader.start()
+
+    def attach(self, audio: np.ndarray) -> None:
+        """Tetapkan array sumber PCM (dibaca lewat memoryview, tanpa salinan jika contiguous)"""
+        with self._cond:
+            self._pcm = memoryview(np.ascontiguousarray(audio).reshape(-1)).cast('B')
+            self._cond.notify()
+
+    def advance(self, samples: int) -> None:
+        """Tandai sampel [0, samples) sudah final sehingga boleh di-encode"""
+        with self._cond:
+            self._limit = max(self._limit, samples * 2)
+            self._cond.notify()
+
+    def _write_loop(self) -> None:
+        fed = 0
+        try:
+            while True:
+                with self._cond:
+                    while not self._closing and (self._pcm is None or fed >= self._limit):
+                        self._cond.wait()
+                    if self._pcm is None or fed >= min(self._limit, len(self._pcm)):
+                        break
+                    chunk = self._pcm[fed:min(self._limit, len(self._pcm))]
+                while chunk:
+                    written = self.proc.stdin.write(chunk)
+                    fed += written
+                    chunk = chunk[written:]
+        except (BrokenPipeError, OSError, ValueError) as e:
+            self._error = e
+        finally:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+
+    def _read_loop(self, destination: BinaryIO) -> None:
+        try:
+            for block in iter(lambda: self.proc.stdout.read(1 << 16), b''):
+                destination.write(block)
+        except Exception as e:
+            self._error = e
+            self.proc.kill()
+
+    def finish(self) -> None:
+        """Kirim sisa sampel, tunggu ffmpeg selesai; IOError jika encoding gagal"""
+        with self._cond:
+            if self._pcm is None:
+                self._closing = True
+                self._cond.notify()
+                raise IOError("Tidak ada audio untuk di-encode")
+            self._limit = len(self._pcm)
+            self._closing = True
+            self._cond.notify()
+        self._writer.join()
+        if self._reader is not None:
+            self._reader.join()
+        self.proc.wait()
+        err = self._stderr.text()
+        if self.proc.returncode != 0 or self._error is not None:
+            detail = err or self._error
+            raise IOError(f"ffmpeg gagal encode {self.format_name}: {detail}")
+
+    def abort(self) -> None:
+        """Hentikan encoder (mis. embedding gagal); aman dipanggil setelah finish()"""
+        if self.proc.poll() is None:
+            self.proc.kill()
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._writer.join()
+        if self._reader is not None:
+            self._reader.join()
+        self.proc.wait()
+
+
+class NumpyPositionGenerator:
+    """Generator posisi acak berbasis NumPy (PCG64) dengan state per instance.
+
+    Tidak memakai modul random global sehingga aman dipakai paralel antar thread.
+    Permutasi disimpan sebagai int32 (int64 jika N >= 2^31) untuk menghemat memori.
+    """
+
+    def __init__(self, seed_string: str, max_positions: int):
+        seed_hash = hashlib.sha256(seed_string.encode('utf-8')).digest()
+        self.seed = int.from_bytes(seed_hash[:16], 'little')
+        self.max_positions = max_positions
+
+    def permutation(self) -> np.ndarray:
+        dtype = np.int32 if self.max_positions < 2**31 else np.int64
+        positions = np.arange(self.max_positions, dtype=dtype)
+        np.random.Generator(np.random.PCG64(self.seed)).shuffle(positions)
+        return positions
+
+
+class PermutationCache:
+    """Cache LRU permutasi posisi acak, dikunci dengan (prng, HMAC seed, N).
+
+    Kunci cache memakai HMAC dari seed dengan secret acak per instance, sehingga
+    baik memori maupun nama file spill tidak memuat verifier kunci stego.
+    Permutasi disimpan di memori hingga max_bytes; jika spill_dir diberikan,
+    permutasi yang dikeluarkan dari memori disimpan sebagai .npy (di subdirektori
+    milik instance ini) dan dibuka kembali sebagai memmap, hingga spill_max_bytes.
+    Setelah itu file spill paling lama dipakai dihapus.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, spill_dir: Optional[str] = None,
+                 spill_max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.spill_max_bytes = spill_max_bytes if spill_max_bytes is not None else 4 * max_bytes
+        self._secret = os.urandom(32)
+        self._entries: "OrderedDict[Tuple[str, str, int], np.ndarray]" = OrderedDict()
+        self._used = 0
+        self._spilled = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[str, str, int], threading.Lock] = {}
+        self.spill_dir = None
+        if spill_dir:
+            root = Path(spill_dir)
+            root.mkdir(parents=True, exist_ok=True)
+            self._remove_stale_spills(root)
+            # Subdirektori per proses/instance: proses lain (mis. worker pool) tidak saling hapus
+            self.spill_dir = root / f"{os.getpid()}-{os.urandom(4).hex()}"
+            self.spill_dir.mkdir()
+
+    @staticmethod
+    def _remove_stale_spills(root: Path) -> None:
+        """Hapus subdirektori spill milik proses yang sudah tidak berjalan"""
+        import shutil
+        for path in root.iterdir():
+            pid = path.name.split('-', 1)[0]
+            if not path.is_dir() or not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+                continue  # Proses masih hidup
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _key(self, prng: str, seed_string: str, n: int) -> Tuple[str, str, int]:
+        return prng, hmac.new(self._secret, seed_string.encode('utf-8'), hashlib.sha256).hexdigest(), n
+
+    def _spill_path(self, key: Tuple[str, str, int]) -> Optional[Path]:
+        if self.spill_dir is None:
+            return None
+        prng, seed_tag, n = key
+        return self.spill_dir / f"{prng}_{seed_tag}_{n}.npy"
+
+    def get(self, prng: str, seed_string: str, n: int) -> np.ndarray:
+        """Ambil permutasi [0, n) untuk seed, buat jika belum ada di cache"""
+        key = self._key(prng, seed_string, n)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Satu thread membuat permutasi, thread lain dengan kunci sama menunggu
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+
+            if prng == AudioSteganography.PRNG_LEGACY:
+                dtype = np.int32 if n < 2**31 else np.int64
+                positions = np.asarray(RandomPositionGenerator(seed_string, n).generate_positions(n), dtype=dtype)
+            else:
+                positions = NumpyPositionGenerator(seed_string, n).permutation()
+
+            with self._lock:
+                self._insert(key, positions)
+                self._key_locks.pop(key, None)
+            return positions
+
+    def _insert(self, key, positions: np.ndarray) -> None:
+        self._used += positions.nbytes
+        self._entries[key] = positions
+
+        # Keluarkan permutasi in-memory paling lama dipakai hingga muat di max_bytes
+        while self._used > self.max_bytes:
+            victim = next((k for k, v in self._entries.items()
+                           if k != key and not isinstance(v, np.memmap)), None)
+            if victim is None:
+                break
+            old = self._entries.pop(victim)
+            self._used -= old.nbytes
+            spill_path = self._spill_path(victim)
+            if spill_path is not None and old.nbytes <= self.spill_max_bytes:
+                tmp_path = spill_path.with_name(spill_path.stem + '.tmp.npy')
+                np.save(tmp_path, old)
+                os.replace(tmp_path, spill_path)
+                self._entries[victim] = np.load(spill_path, mmap_mode='r')
+                self._spilled += old.nbytes
+
+        # File spill paling lama dipakai dihapus hingga muat di spill_max_bytes
+        # (memmap yang masih dipegang pemanggil tetap valid setelah unlink)
+        while self._spilled > self.spill_max_bytes:
+            victim = next((k for k, v in self._entries.items() if isinstance(v, np.memmap)), None)
+            if victim is None:
+                break
+            self._drop_spill(victim)
+
+    def _drop_spill(self, key) -> None:
+        old = self._entries.pop(key)
+        self._spilled -= old.nbytes
+        self._spill_path(key).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in [k for k, v in self._entries.items() if isinstance(v, np.memmap)]:
+                self._drop_spill(key)
+            self._entries.clear()
+            self._used = 0
+
+
 class AudioSteganography:
     """Kelas utama untuk steganografi audio - FIXED VERSION"""
     
     SIGNATURE = b'AUDIOSTG'  # Signature untuk identifikasi (8 bytes)
+    # PRNG posisi acak; file lama (tanpa 'prng' di metadata) memakai PRNG_LEGACY
+    PRNG_LEGACY = 'python-random'
+    PRNG = 'pcg64'
     METADATA_SIZE_BYTES = 4  # 4 bytes untuk ukuran metadata
+    KEY_SALT_BYTES = 8  # Salt untuk tag verifikasi kunci di metadata
+    KEY_CHECK_BYTES = 4  # Panjang tag verifikasi kunci
+    # Tag diturunkan dengan PBKDF2 agar kunci tidak bisa ditebak offline secepat SHA-256;
+    # iterasi disimpan di header dan dibatasi saat verifikasi (header bisa dari siapa saja)
+    KEY_CHECK_KDF = 'pbkdf2-sha256'
+    KEY_CHECK_ITERATIONS = 100_000
+    KEY_CHECK_MAX_ITERATIONS = 1_000_000
+    SEGMENT_SAMPLES = 1 << 20  # Ukuran minimal segmen untuk pemrosesan paralel
+    OUTPUT_FORMATS = ('wav', 'flac', 'mp3')  # Format output yang dapat dipilih
+    MP3_BITRATE = "320k"
+    EXTRACT_CHUNK_BYTES = 1 << 20  # Ukuran potongan untuk ekstraksi streaming
     
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None,
+                 permutation_cache: Optional[PermutationCache] = None,
+                 progress_callback: Optional[Callable[[str, int, int], None]] = None,
+                 cancel_token: Optional["CancellationToken"] = None,
+                 profile_memory: bool = False):
         self.audio_data = None
         self.sample_rate = None
         self.channels = None
+        # Statistik perubahan dari embedding terakhir (lihat _record_embed_stats)
+        self.embed_stats = None
+        # Delta sampel dari embedding copy-on-touch terakhir (lihat CoverSession)
+        self.embed_delta = None
+        # Path file yang terakhir dimuat (untuk output patch in-place)
+        self.source_path = None
+        # Jumlah thread untuk embedding/ekstraksi per segmen (default: semua core)
+        self.workers = workers or os.cpu_count() or 1
+        # Cache permutasi posisi acak, dibagi antar instance secara default
+        self.permutation_cache = permutation_cache or PERMUTATION_CACHE
+        # progress_callback(stage, selesai, total) dipanggil antar blok; cancel_token
+        # dicek antar blok dan membatalkan operasi dengan OperationCancelled
+        self.progress_callback = progress_callback
+        self.cancel_token = cancel_token
+        # Profil memori per tahap (decode, embed, extract, export, psnr) bila diminta
+        self.memory_profiler = MemoryProfiler() if profile_memory else None
+        # Encoder ffmpeg yang diisi selama embedding berikutnya (lihat stream_encode)
+        self.encode_streams: List[PCMEncodeStream] = []
         
-    def load_audio(self, file_path: str) -> bool:
-        """Load file audio (MP3, WAV, FLAC, dll)"""
+    @profiled_stage('decode')
+    def load_audio(self, file_path: Union[str, BinaryIO, bytes], format: Optional[str] = None) -> bool:
+        """Load audio (MP3, WAV, FLAC, dll) dari path, file-like object, atau bytes.
+
+        Untuk file-like/bytes, format diambil dari argumen format (mis. 'wav').
+        """
         try:
-            if not os.path.exists(file_path):
-                print(f"Error: File {file_path} tidak ditemukan!")
-                return False
-            
-            # Deteksi format file
-            ext = os.path.splitext(file_path)[1].lower()
-            
-            if ext == '.mp3':
-                audio = AudioSegment.from_mp3(file_path)
-            elif ext == '.wav':
-                audio = AudioSegment.from_wav(file_path)
-            elif ext == '.flac':
-                audio = AudioSegment.from_file(file_path, format="flac")
-            elif ext == '.ogg':
-                audio = AudioSegment.from_ogg(file_path)
+            if isinstance(file_path, (bytes, bytearray, memoryview)):
+                file_path = io.BytesIO(file_path)
+
+            if isinstance(file_path, str):
+                if not os.path.exists(file_path):
+                    print(f"Error: File {file_path} tidak ditemukan!")
+                    return False
+                
+                # Deteksi format file
+                ext = os.path.splitext(file_path)[1].lower()
             else:
-                # Coba auto-detect
-                audio = AudioSegment.from_file(file_path)
+                ext = f".{format.lower().lstrip('.')}" if format else ''
             
-            # Konversi ke raw audio data
-            self.audio_data = np.array(audio.get_array_of_samples(), dtype=np.int16)
-            self.sample_rate = audio.frame_rate
-            self.channels = audio.channels
+            if ext != '.wav' and ffmpeg_tools() is not None:
+                # Format terkompresi: PCM dari pipe ffmpeg langsung ke array NumPy
+                self.audio_data, self.sample_rate, self.channels = ffmpeg_decode(
+                    file_path, ext.lstrip('.') or None, self.cancel_token)
+            else:
+                if ext == '.mp3':
+                    audio = _audio_segment().from_mp3(file_path)
+                elif ext == '.wav':
+                    audio = _audio_segment().from_wav(file_path)
+                elif ext == '.flac':
+                    audio = _audio_segment().from_file(file_path, format="flac")
+                elif ext == '.ogg':
+                    audio = _audio_segment().from_ogg(file_path)
+                else:
+                    # Coba auto-detect
+                    audio = _audio_segment().from_file(file_path)
+
+                # Konversi ke raw audio data
+                self.audio_data = np.array(audio.get_array_of_samples(), dtype=np.int16)
+                self.sample_rate = audio.frame_rate
+                self.channels = audio.channels
+            # Decode pydub tidak bisa disela; pembatalan selama decode berlaku di sini
+            self._check_cancelled()
+            self.source_path = file_path if isinstance(file_path, str) else None
             
             # Jika stereo, reshape menjadi 2D array
             if self.channels == 2:
@@ -132,51 +811,139 @@ class AudioSteganography:
                 
             return True
             
+        except OperationCancelled:
+            raise
         except Exception as e:
             print(f"Error loading audio: {e}")
             return False
     
+    def map_wav(self, file_path: str) -> bool:
+        """Memory-map WAV PCM 16-bit sebagai audio_data (read-only, tanpa decode penuh).
+
+        Hanya sampel yang dibaca/ditulis yang benar-benar diakses dari disk.
+        """
+        try:
+            layout = read_wav_layout(file_path)
+            if (layout is None or layout['format_tag'] not in (1, 0xFFFE)
+                    or layout['bits_per_sample'] != 16):
+                print(f"Error: {file_path} bukan WAV PCM 16-bit")
+                return False
+            n_samples = layout['data_size'] // 2
+            self.audio_data = np.memmap(file_path, dtype='<i2', mode='r',
+                                        offset=layout['data_offset'], shape=(n_samples,))
+            self.sample_rate = layout['sample_rate']
+            self.channels = layout['channels']
+            if self.channels == 2:
+                self.audio_data = self.audio_data.reshape(-1, 2)
+            self.source_path = file_path
+            return True
+        except Exception as e:
+            print(f"Error mapping WAV: {e}")
+            return False
+
+    def _to_segment(self) -> "AudioSegment":
+        """Bungkus audio data sebagai AudioSegment 16-bit"""
+        return _audio_segment()(
+            self._flat_audio().tobytes(),
+            frame_rate=self.sample_rate,
+            sample_width=2,  # 16-bit
+            channels=self.channels
+        )
+
+    @profiled_stage('export')
+    def export_audio(self, file_path: Union[str, BinaryIO], format_name: str) -> bool:
+        """Simpan audio data ke tepat satu file (path atau file-like) dengan format tertentu"""
+        try:
+            if self.audio_data is None:
+                print("Error: Tidak ada audio data untuk disimpan")
+                return False
+
+            if isinstance(file_path, str):
+                os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+
+            if format_name in FFMPEG_ENCODERS and ffmpeg_tools() is not None:
+                # PCM dikirim dari memoryview array ke stdin ffmpeg, tanpa AudioSegment/file sementara
+                stream = self._encode_stream(format_name, file_path)
+                stream.attach(self._flat_audio())
+                try:
+                    stream.finish()
+                except Exception:
+                    stream.abort()
+                    raise
+            else:
+                audio = self._to_segment()
+                if format_name == 'mp3':
+                    audio.export(file_path, format="mp3", bitrate=self.MP3_BITRATE)
+                else:
+                    audio.export(file_path, format=format_name)
+            if format_name == 'mp3':
+                print(f"✓ File MP3 (untuk distribusi, data stego mungkin rusak): {file_path}")
+            else:
+                print(f"Audio disimpan ke: {file_path}")
+            return True
+
+        except Exception as e:
+            print(f"Error saving audio: {e}")
+            return False
+
+    def to_bytes(self, format_name: str = 'wav') -> bytes:
+        """Encode audio data ke bytes di memori, tanpa file perantara"""
+        buffer = io.BytesIO()
+        if not self.export_audio(buffer, format_name):
+            raise IOError(f"Gagal meng-encode audio ke {format_name}")
+        return buffer.getvalue()
+
+    def _encode_stream(self, format_name: str, destination: Union[str, BinaryIO]) -> PCMEncodeStream:
+        return PCMEncodeStream(format_name, self.sample_rate, self.channels, destination,
+                               bitrate=self.MP3_BITRATE if format_name == 'mp3' else None)
+
+    def stream_encode(self, format_name: str, destination: Union[str, BinaryIO]) -> Optional[PCMEncodeStream]:
+        """Mulai encoder ffmpeg yang diisi selama embed_bytes berikutnya.
+
+        Sampel yang sudah final (header, blok berurutan yang selesai) langsung
+        di-encode sementara blok berikutnya masih disisipkan. Setelah embedding
+        berhasil panggil finish() pada hasilnya, jika gagal abort(). None jika
+        format tidak di-encode lewat ffmpeg atau ffmpeg tidak tersedia.
+        """
+        if format_name not in FFMPEG_ENCODERS or ffmpeg_tools() is None:
+            return None
+        stream = self._encode_stream(format_name, destination)
+        self.encode_streams.append(stream)
+        return stream
+
+    def save_outputs(self, base_path: str, output_formats: List[str]) -> Dict[str, str]:
+        """Simpan audio hanya dalam format yang diminta, sebagai <base_path>.<format>"""
+        base = os.path.splitext(base_path)[0]
+        outputs = {}
+        for format_name in output_formats:
+            if format_name not in self.OUTPUT_FORMATS:
+                raise ValueError(f"Format output tidak didukung: {format_name}")
+            file_path = f"{base}.{format_name}"
+            if not self.export_audio(file_path, format_name):
+                raise IOError(f"Gagal menyimpan output {format_name}")
+            outputs[format_name] = file_path
+        return outputs
+
     def save_audio(self, file_path: str) -> bool:
         """Simpan audio data ke file (WAV untuk steganografi, MP3 untuk hasil akhir)"""
         try:
             if self.audio_data is None:
                 print("Error: Tidak ada audio data untuk disimpan")
                 return False
-                
-            # Flatten audio data jika stereo
-            if self.channels == 2:
-                audio_array = self.audio_data.flatten()
-            else:
-                audio_array = self.audio_data
-            
-            # Buat AudioSegment dari array
-            audio = AudioSegment(
-                audio_array.tobytes(),
-                frame_rate=self.sample_rate,
-                sample_width=2,  # 16-bit
-                channels=self.channels
-            )
-            
-            # Buat directory jika belum ada
-            os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
             
             # PENTING: Untuk steganografi, simpan sebagai WAV (lossless) 
             # agar LSB tidak rusak akibat MP3 compression
             if file_path.lower().endswith('.mp3'):
                 # Ganti ekstensi ke .wav untuk steganografi
                 wav_path = file_path[:-4] + '_stego.wav'
-                audio.export(wav_path, format="wav")
+                if not self.export_audio(wav_path, 'wav'):
+                    return False
                 print(f"⚠ PENTING: Audio disimpan sebagai WAV (lossless) untuk menjaga steganografi")
                 print(f"✓ File stego: {wav_path}")
                 print(f"💡 Tip: Gunakan file .wav untuk ekstraksi, bukan .mp3")
                 
                 # Optional: buat juga versi MP3 untuk distribusi (tapi data stego akan rusak)
-                try:
-                    audio.export(file_path, format="mp3", bitrate="320k")
-                    print(f"✓ File MP3 (untuk distribusi, data stego mungkin rusak): {file_path}")
-                except:
-                    pass
-                    
+                self.export_audio(file_path, 'mp3')
                 return True
             else:
                 # Jika ekstensi bukan .mp3, simpan sesuai format yang diminta
@@ -188,15 +955,56 @@ class AudioSteganography:
                 
                 ext = os.path.splitext(file_path)[1].lower()
                 format_name = format_map.get(ext, 'wav')
-                
-                audio.export(file_path, format=format_name)
-                print(f"Audio disimpan ke: {file_path}")
-                return True
+                return self.export_audio(file_path, format_name)
             
         except Exception as e:
             print(f"Error saving audio: {e}")
             return False
     
+    def patch_wav(self, cover_path: str, output_path: str) -> bool:
+        """Tulis hasil embedding copy-on-touch dengan meng-clone cover WAV lalu
+        menulis hanya sampel yang berubah pada offset byte-nya.
+
+        Biaya sebanding dengan ukuran payload, bukan panjang lagu. Butuh
+        embed_delta (embed_bytes dengan copy_on_touch=True) dan cover WAV PCM 16-bit
+        yang sama dengan audio yang dimuat.
+        """
+        try:
+            if self.embed_delta is None:
+                print("Error: Tidak ada delta embedding untuk ditulis")
+                return False
+            layout = read_wav_layout(cover_path)
+            if (layout is None or layout['format_tag'] not in (1, 0xFFFE)
+                    or layout['bits_per_sample'] != 16
+                    or layout['data_size'] // 2 != self.audio_data.size):
+                print("Error: Cover bukan WAV PCM 16-bit yang cocok untuk patch in-place")
+                return False
+
+            if os.path.abspath(cover_path) == os.path.abspath(output_path):
+                method = 'in-place'
+            else:
+                method = clone_file(cover_path, output_path)
+            # memmap: hanya halaman yang berisi sampel yang disentuh yang ditulis
+            samples = np.memmap(output_path, dtype='<i2', mode='r+',
+                                offset=layout['data_offset'], shape=(self.audio_data.size,))
+            for positions, start_sample, touched, _ in self.embed_delta:
+                if positions is not None:
+                    samples[positions] = touched
+                else:
+                    samples[start_sample:start_sample + len(touched)] = touched
+            samples.flush()
+            del samples
+
+            touched_total = sum(len(entry[2]) for entry in self.embed_delta)
+            print(f"✓ Patch in-place ({method}): {touched_total} sampel ditulis ke {output_path}")
+            return True
+
+        except Exception as e:
+            print(f"Error patching WAV: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
     def calculate_capacity(self, n_lsb: int) -> int:
         """Hitung kapasitas penyisipan dalam bytes"""
         if self.audio_data is None:
@@ -213,221 +1021,342 @@ class AudioSteganography:
         available_bytes = available_bits // 8
         
         return max(0, available_bytes)
-    def _extract_bits_random(self, n_lsb: int, start_sample: int, n_bits: int, seed_string: str) -> list[int]:
+
+    def _segments(self, total: int) -> List[Tuple[int, int]]:
+        """Bagi rentang indeks [0, total) menjadi blok ~SEGMENT_SAMPLES untuk diproses paralel"""
+        if total <= 0:
+            return []
+        # Blok minimal SEGMENT_SAMPLES agar overhead thread tidak dominan; jumlah blok
+        # yang cukup banyak juga memberi titik cek pembatalan dan progress
+        n_segments = max(1, -(-total // self.SEGMENT_SAMPLES))
+        bounds = np.linspace(0, total, n_segments + 1, dtype=np.int64)
+        return [(int(bounds[i]), int(bounds[i + 1])) for i in range(n_segments)]
+
+    def _stage(self, name: str):
+        """Context manager profil memori untuk satu tahap (no-op jika tidak aktif)"""
+        if self.memory_profiler is None:
+            return nullcontext()
+        return self.memory_profiler.stage(name)
+
+    @property
+    def memory_profile(self) -> Optional[Dict[str, Dict[str, float]]]:
+        return None if self.memory_profiler is None else self.memory_profiler.stages
+
+    def _check_cancelled(self) -> None:
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
+
+    def _report_progress(self, stage: str, done: int, total: int) -> None:
+        if self.progress_callback is not None:
+            self.progress_callback(stage, done, total)
+
+    def _run_segments(self, total: int, fn, stage: Optional[str] = None,
+                      on_prefix_done: Optional[Callable[[int], None]] = None) -> list:
+        """Jalankan fn(start, end) untuk setiap blok, paralel jika workers > 1.
+
+        Operasi NumPy di dalam fn melepas GIL, sehingga thread pool cukup untuk
+        memanfaatkan banyak core. Blok saling lepas sehingga hasilnya identik
+        dengan eksekusi single-thread. Pembatalan dicek sebelum setiap blok dan,
+        jika stage diberikan, progress dilaporkan setelah setiap blok selesai.
+        on_prefix_done(end) dipanggil setiap kali blok [0, end) semuanya selesai.
+        Mengembalikan hasil fn per blok (urut).
+        """
+        segments = self._segments(total)
+
+        def run_block(start, end):
+            self._check_cancelled()
+            return fn(start, end)
+
+        if self.workers <= 1 or len(segments) <= 1:
+            results = []
+            for start, end in segments:
+                results.append(run_block(start, end))
+                if stage:
+                    self._report_progress(stage, end, total)
+                if on_prefix_done is not None:
+                    on_prefix_done(end)
+            return results
+
+        pool = ThreadPoolExecutor(max_workers=min(self.workers, len(segments)))
+        try:
+            futures = {pool.submit(run_block, start, end): (start, end) for start, end in segments}
+            done = 0
+            finished, prefix = {}, 0
+            for future in as_completed(futures):
+                future.result()
+                start, end = futures[future]
+                done += end - start
+                if stage:
+                    self._report_progress(stage, done, total)
+                if on_prefix_done is not None:
+                    # Blok bisa selesai tidak berurutan; laporkan hanya prefix yang utuh
+                    finished[start] = end
+                    while prefix in finished:
+                        prefix = finished.pop(prefix)
+                    on_prefix_done(prefix)
+            return [future.result() for future in futures]
+        finally:
+            # Saat dibatalkan/gagal, blok yang belum mulai tidak dijalankan
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _flat_audio(self) -> np.ndarray:
+        """View 1D dari audio data (tanpa copy untuk array C-contiguous)"""
+        return self.audio_data.reshape(-1)
+
+    def _random_data_positions(self, seed_string: str, start_sample: int, count: int,
+                               prng: Optional[str] = None) -> np.ndarray:
+        """Posisi acak untuk data rahasia, hanya posisi setelah header"""
+        total_samples = self.audio_data.size
+        all_positions = self.permutation_cache.get(prng or self.PRNG, seed_string, total_samples)
+
+        # Ambil count posisi pertama setelah header (start_sample), per blok agar
+        # tidak perlu memfilter seluruh permutasi ketika count kecil
+        found = []
+        n_found = 0
+        block = max(count + start_sample, 1 << 16)
+        for offset in range(0, len(all_positions), block):
+            chunk = all_positions[offset:offset + block]
+            chunk = chunk[chunk >= start_sample]
+            found.append(chunk[:count - n_found])
+            n_found += len(found[-1])
+            if n_found >= count:
+                break
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(found).astype(np.int64, copy=False)
+
+    def _gather_lsb(self, flat_audio: np.ndarray, n_lsb: int, positions=None,
+                    start_sample: int = 0, count: int = 0) -> np.ndarray:
+        """Ambil n LSB dari sampel (berurutan atau pada posisi tertentu) secara paralel"""
+        total = len(positions) if positions is not None else count
+        values = np.empty(total, dtype=np.uint8)
+        lsb_mask = (1 << n_lsb) - 1
+
+        def work(start, end):
+            if positions is not None:
+                samples = flat_audio[positions[start:end]]
+            else:
+                samples = flat_audio[start_sample + start:start_sample + end]
+            np.bitwise_and(samples, lsb_mask, out=values[start:end], casting='unsafe')
+
+        self._run_segments(total, work)
+        return values
+
+    def _scatter_lsb(self, flat_audio: np.ndarray, n_lsb: int, values: np.ndarray,
+                     positions=None, start_sample: int = 0,
+                     stage: Optional[str] = None,
+                     on_prefix_done: Optional[Callable[[int], None]] = None) -> Tuple[int, int, int]:
+        """Tulis n LSB ke sampel (berurutan atau pada posisi tertentu) secara paralel.
+
+        Mengembalikan statistik perubahan (jumlah selisih kuadrat, jumlah sampel
+        yang berubah, deviasi maksimum) yang dihitung sambil menulis.
+        """
+        clear_mask = np.array(~((1 << n_lsb) - 1)).astype(flat_audio.dtype)
+        values = values.astype(flat_audio.dtype, copy=False)
+
+        def work(start, end):
+            if positions is not None:
+                idx = positions[start:end]
+                old = flat_audio[idx]
+                new = (old & clear_mask) | values[start:end]
+                flat_audio[idx] = new
+            else:
+                segment = flat_audio[start_sample + start:start_sample + end]
+                old = segment
+                new = (segment & clear_mask) | values[start:end]
+            diff = new.astype(np.int32) - old
+            if positions is None:
+                segment[...] = new
+            if diff.size == 0:
+                return 0, 0, 0
+            return (int(np.dot(diff.astype(np.int64), diff)),
+                    int(np.count_nonzero(diff)),
+                    int(np.abs(diff).max()))
+
+        results = self._run_segments(len(values), work, stage, on_prefix_done)
+        return (sum(r[0] for r in results),
+                sum(r[1] for r in results),
+                max((r[2] for r in results), default=0))
+
+    def _write_lsb(self, flat_audio: np.ndarray, n_lsb: int, values: np.ndarray,
+                   positions=None, start_sample: int = 0, stage: Optional[str] = None,
+                   delta: Optional[list] = None,
+                   on_prefix_done: Optional[Callable[[int], None]] = None) -> Tuple[int, int, int]:
+        """Tulis LSB langsung ke flat_audio, atau (copy-on-touch) ke salinan sampel yang disentuh.
+
+        Dengan delta, flat_audio tidak diubah: hanya sampel yang disentuh disalin,
+        ditulis, lalu dicatat sebagai (positions, start_sample, sampel_baru, n_lsb).
+        """
+        if delta is None:
+            return self._scatter_lsb(flat_audio, n_lsb, values, positions=positions,
+                                     start_sample=start_sample, stage=stage,
+                                     on_prefix_done=on_prefix_done)
+        if positions is not None:
+            touched = flat_audio[positions]  # fancy indexing sudah membuat salinan
+        else:
+            touched = flat_audio[start_sample:start_sample + len(values)].copy()
+        stats = self._scatter_lsb(touched, n_lsb, values, stage=stage)
+        delta.append((positions, start_sample, touched, n_lsb))
+        return stats
+
+    def _record_embed_stats(self, sse: int, modified: int, max_deviation: int) -> None:
+        """Simpan statistik embedding dan PSNR output lossless tanpa pass kedua"""
+        total_samples = self.audio_data.size
+        mse = sse / total_samples if total_samples else 0.0
+        # Sama dengan psnr_from_arrays(cover, stego) untuk output lossless
+        psnr = float('inf') if mse == 0 else float(10 * np.log10(32767.0 ** 2 / mse))
+        self.embed_stats = {
+            'sum_squared_diff': sse,
+            'modified_samples': modified,
+            'max_deviation': max_deviation,
+            'mse': mse,
+            'psnr': psnr,
+        }
+
+    @staticmethod
+    def _group_bits(bits: np.ndarray, n_lsb: int) -> np.ndarray:
+        """Gabungkan bit menjadi nilai n-bit per sampel (bit pertama di LSB)"""
+        pad = (-len(bits)) % n_lsb
+        if pad:
+            bits = np.concatenate([bits, np.zeros(pad, dtype=np.uint8)])
+        groups = bits.reshape(-1, n_lsb)
+        weights = (1 << np.arange(n_lsb, dtype=np.uint8))
+        return (groups * weights).sum(axis=1, dtype=np.uint8)
+
+    @staticmethod
+    def _ungroup_bits(values: np.ndarray, n_lsb: int, n_bits: int) -> np.ndarray:
+        """Pecah nilai n-bit per sampel kembali menjadi bit (LSB first)"""
+        shifts = np.arange(n_lsb, dtype=np.uint8)
+        bits = (values[:, None] >> shifts) & 1
+        return bits.reshape(-1)[:n_bits].astype(np.uint8)
+
+    def _extract_bits_random(self, n_lsb: int, start_sample: int, n_bits: int, seed_string: str,
+                             prng: Optional[str] = None) -> np.ndarray:
         """Ekstraksi bit dari audio menggunakan posisi acak"""
         if self.audio_data is None:
             raise ValueError("Audio data tidak dimuat")
-        
-        total_samples = self.audio_data.size
-        
-        # Flatten audio
-        if self.channels == 2:
-            flat_audio = self.audio_data.flatten()
-        else:
-            flat_audio = self.audio_data
-        
-        # Generator posisi acak
-        pos_gen = RandomPositionGenerator(seed_string, total_samples)
-        all_positions = pos_gen.generate_positions(total_samples)
-        
-        # Ambil posisi setelah header (start_sample)
-        data_positions = [pos for pos in all_positions if pos >= start_sample]
-        
+
         # Hitung jumlah sampel yang diperlukan
         required_samples = (n_bits + n_lsb - 1) // n_lsb
-        data_positions = data_positions[:required_samples]
-        
-        extracted_bits = []
-        for sample_pos in data_positions:
-            if len(extracted_bits) >= n_bits:
-                break
-            
-            sample = int(flat_audio[sample_pos])
-            bits_value = sample & ((1 << n_lsb) - 1)
-            
-            for i in range(n_lsb):
-                if len(extracted_bits) >= n_bits:
-                    break
-                extracted_bits.append((bits_value >> i) & 1)
-        
-        return extracted_bits
+        data_positions = self._random_data_positions(seed_string, start_sample, required_samples, prng)
 
-    def _extract_bits_sequential(self, n_lsb: int, start_sample: int, num_bits: int) -> List[int]:
-        """Ekstrak bits secara berurutan mulai dari sample tertentu (FIXED)"""
+        values = self._gather_lsb(self._flat_audio(), n_lsb, positions=data_positions)
+        return self._ungroup_bits(values, n_lsb, n_bits)
+
+    def _extract_bits_sequential(self, n_lsb: int, start_sample: int, num_bits: int) -> np.ndarray:
+        """Ekstrak bits secara berurutan mulai dari sample tertentu"""
         if self.audio_data is None:
             raise ValueError("Audio data tidak dimuat")
-        
+
         total_samples = self.audio_data.size
-        if self.channels == 2:
-            flat_audio = self.audio_data.flatten()
-        else:
-            flat_audio = self.audio_data
-        
-        extracted_bits = []
-        current_sample = start_sample
-        
-        # For 1-LSB extraction (used for header parts: signature, metadata_size, metadata)
-        if n_lsb == 1:
-            for i in range(num_bits):
-                if current_sample >= total_samples:
-                    break
-                sample = int(flat_audio[current_sample])
-                bit = sample & 1  # Extract LSB
-                extracted_bits.append(bit)
-                current_sample += 1
-        else:
-            # For n-LSB extraction (used for secret data)
-            bits_needed = num_bits
-            
-            while bits_needed > 0 and current_sample < total_samples:
-                sample = int(flat_audio[current_sample])
-                
-                # Extract n bits from this sample (LSB first order to match embedding)
-                bits_to_extract = min(n_lsb, bits_needed)
-                
-                for bit_pos in range(bits_to_extract):
-                    bit = (sample >> bit_pos) & 1
-                    extracted_bits.append(bit)
-                    bits_needed -= 1
-                    
-                    if bits_needed <= 0:
-                        break
-                
-                current_sample += 1
-        
-        return extracted_bits[:num_bits]
-    
-    def _bits_to_bytes(self, bits: List[int]) -> bytes:
-        """Konversi list of bits ke bytes (FIXED)"""
-        # Pad to nearest byte boundary
-        while len(bits) % 8 != 0:
-            bits.append(0)
-        
-        data = bytearray()
-        for i in range(0, len(bits), 8):
-            byte_val = 0
-            # Reconstruct byte: first bit goes to MSB (bit 7), last bit goes to LSB (bit 0)
-            for j in range(8):
-                if i + j < len(bits):
-                    byte_val |= (bits[i + j] << (7 - j))
-            data.append(byte_val)
-        
-        return bytes(data)
-    
-    def _embed_bits(self, data: bytes, n_lsb: int, use_random: bool, 
-                    seed_string: str) -> bool:
-        """Sisipkan data ke dalam audio menggunakan n-LSB (FIXED)"""
+        required_samples = (num_bits + n_lsb - 1) // n_lsb
+        count = max(0, min(required_samples, total_samples - start_sample))
+
+        values = self._gather_lsb(self._flat_audio(), n_lsb, start_sample=start_sample, count=count)
+        return self._ungroup_bits(values, n_lsb, num_bits)
+
+    def _bits_to_bytes(self, bits) -> bytes:
+        """Konversi bits ke bytes (bit pertama menjadi MSB, dipad ke batas byte)"""
+        return np.packbits(np.asarray(bits, dtype=np.uint8)).tobytes()
+
+    def _embed_bits(self, data: bytes, n_lsb: int, use_random: bool,
+                    seed_string: str, copy_on_touch: bool = False) -> bool:
+        """Sisipkan data ke dalam audio menggunakan n-LSB.
+
+        Dengan copy_on_touch, audio_data tidak diubah dan hasilnya disimpan
+        sebagai delta sampel di self.embed_delta.
+        """
+        # Encoder yang didaftarkan lewat stream_encode diisi sambil embedding berjalan
+        streams, self.encode_streams = self.encode_streams, []
         try:
             if self.audio_data is None:
                 raise ValueError("Audio data tidak dimuat")
-            
+            if copy_on_touch and streams:
+                raise ValueError("stream_encode tidak bisa dipakai dengan copy_on_touch")
+
             total_samples = self.audio_data.size
-            # Buat copy untuk menghindari modifikasi original
-            if self.channels == 2:
-                flat_audio = self.audio_data.flatten().copy()
+            if copy_on_touch:
+                # Cover dipakai read-only; hanya sampel yang disentuh yang disalin
+                flat_audio = self._flat_audio()
+                delta = []
             else:
-                flat_audio = self.audio_data.copy()
-            
+                # Buat copy untuk menghindari modifikasi original
+                flat_audio = self._flat_audio().copy()
+                delta = None
+            for stream in streams:
+                stream.attach(flat_audio)
+
+            def advance_streams(end_sample: int) -> None:
+                for stream in streams:
+                    stream.advance(end_sample)
+
             print(f"Memulai embedding: {len(data)} bytes, n_lsb={n_lsb}, random={use_random}")
-            
+
             # Pisahkan data menjadi bagian-bagian
             signature = self.SIGNATURE
             metadata_size_bytes = data[len(signature):len(signature) + self.METADATA_SIZE_BYTES]
             metadata_size = struct.unpack('<I', metadata_size_bytes)[0]
-            metadata = data[len(signature) + self.METADATA_SIZE_BYTES:len(signature) + self.METADATA_SIZE_BYTES + metadata_size]
-            secret_data = data[len(signature) + self.METADATA_SIZE_BYTES + metadata_size:]
-            
+            header_size = len(signature) + self.METADATA_SIZE_BYTES + metadata_size
+            header = data[:header_size]
+            secret_data = data[header_size:]
+
             print(f"✓ Data breakdown:")
             print(f"  - Signature: {len(signature)} bytes")
             print(f"  - Metadata size: {len(metadata_size_bytes)} bytes (value: {metadata_size})")
-            print(f"  - Metadata: {len(metadata)} bytes")
+            print(f"  - Metadata: {metadata_size} bytes")
             print(f"  - Secret data: {len(secret_data)} bytes")
-            
-            current_sample = 0
-            
-            # Helper function to embed data with 1-LSB
-            def embed_1lsb(data_bytes, start_sample):
-                sample_idx = start_sample
-                for byte in data_bytes:
-                    for bit_pos in range(8):
-                        if sample_idx >= total_samples:
-                            raise ValueError("Tidak cukup ruang untuk data")
-                        
-                        bit = (byte >> (7 - bit_pos)) & 1  # MSB first (bit 7, 6, 5, ... 0)
-                        sample = int(flat_audio[sample_idx])
-                        sample = (sample & ~1) | bit  # Set LSB
-                        flat_audio[sample_idx] = sample
-                        sample_idx += 1
-                return sample_idx
-            
-            # 1. Embed signature dengan 1-LSB berurutan
-            current_sample = embed_1lsb(signature, current_sample)
-            print(f"✓ Signature embedded pada samples 0-{current_sample-1}")
-            
-            # 2. Embed metadata size dengan 1-LSB berurutan  
-            current_sample = embed_1lsb(metadata_size_bytes, current_sample)
-            print(f"✓ Metadata size embedded pada samples {current_sample-32}-{current_sample-1}")
-            
-            # 3. Embed metadata dengan 1-LSB berurutan
-            current_sample = embed_1lsb(metadata, current_sample)
-            print(f"✓ Metadata embedded pada samples {current_sample - len(metadata)*8}-{current_sample-1}")
-            
+
+            # 1-3. Embed signature, metadata size, dan metadata dengan 1-LSB berurutan
+            # (MSB first: bit 7, 6, 5, ... 0)
+            header_bits = np.unpackbits(np.frombuffer(header, dtype=np.uint8))
+            if len(header_bits) > total_samples:
+                raise ValueError("Tidak cukup ruang untuk data")
+            stats = [self._write_lsb(flat_audio, 1, header_bits, start_sample=0, delta=delta)]
+            current_sample = len(header_bits)
+            advance_streams(current_sample)
+            print(f"✓ Header (signature + metadata) embedded pada samples 0-{current_sample-1}")
+
             # 4. Embed secret data dengan n-LSB
             if len(secret_data) > 0:
-                secret_bits = []
-                for byte in secret_data:
-                    for bit_pos in range(8):
-                        secret_bits.append((byte >> (7 - bit_pos)) & 1)  # MSB first
-                
-                required_samples = (len(secret_bits) + n_lsb - 1) // n_lsb
-                
+                secret_bits = np.unpackbits(np.frombuffer(secret_data, dtype=np.uint8))  # MSB first
+                values = self._group_bits(secret_bits, n_lsb)
+                required_samples = len(values)
+
                 if use_random:
                     # Generate posisi acak untuk data
-                    pos_gen = RandomPositionGenerator(seed_string, total_samples)
-                    all_positions = pos_gen.generate_positions(total_samples)
-                    # Ambil posisi setelah header
-                    data_positions = [pos for pos in all_positions if pos >= current_sample]
-                    data_positions = data_positions[:required_samples]
+                    data_positions = self._random_data_positions(seed_string, current_sample, required_samples)
                     print(f"✓ Menggunakan {len(data_positions)} posisi acak")
+                    stats.append(self._write_lsb(flat_audio, n_lsb, values[:len(data_positions)],
+                                                 positions=data_positions, stage='embed', delta=delta))
                 else:
                     # Posisi berurutan
-                    data_positions = list(range(current_sample, current_sample + required_samples))
-                    print(f"✓ Menggunakan {len(data_positions)} posisi berurutan")
-                
-                # Embed secret data dengan n-LSB
-                bit_index = 0
-                for sample_pos in data_positions:
-                    if sample_pos >= total_samples or bit_index >= len(secret_bits):
-                        break
-                    
-                    sample = int(flat_audio[sample_pos])
-                    
-                    # Clear n LSBs
-                    mask = ~((1 << n_lsb) - 1)
-                    sample_cleared = sample & mask
-                    
-                    # Ambil n bits berikutnya
-                    bits_value = 0
-                    bits_to_embed = min(n_lsb, len(secret_bits) - bit_index)
-                    
-                    # Store bits from LSB to MSB within the n-bit group (to match extraction)
-                    for i in range(bits_to_embed):
-                        bits_value |= (secret_bits[bit_index + i] << i)
-                    
-                    sample_new = sample_cleared | bits_value
-                    flat_audio[sample_pos] = sample_new
-                    bit_index += n_lsb
-                
-                print(f"✓ Secret data embedded: {bit_index} bits dari {len(secret_bits)} bits")
-            
-            # Kembalikan ke bentuk asli
-            if self.channels == 2:
-                self.audio_data = flat_audio.reshape(-1, 2)
+                    if current_sample + required_samples > total_samples:
+                        raise ValueError("Tidak cukup ruang untuk data")
+                    print(f"✓ Menggunakan {required_samples} posisi berurutan")
+                    data_start = current_sample
+                    stats.append(self._write_lsb(flat_audio, n_lsb, values, start_sample=current_sample,
+                                                 stage='embed', delta=delta,
+                                                 on_prefix_done=lambda end: advance_streams(data_start + end)))
+
+                print(f"✓ Secret data embedded: {len(secret_bits)} bits")
+
+            if copy_on_touch:
+                self.embed_delta = delta
+                written = delta[0][2]  # header selalu ditulis berurutan dari sampel 0
             else:
-                self.audio_data = flat_audio
-            
+                # Kembalikan ke bentuk asli
+                self.audio_data = flat_audio.reshape(self.audio_data.shape)
+                self.embed_delta = None
+                written = self._flat_audio()
+            self._record_embed_stats(sum(st[0] for st in stats), sum(st[1] for st in stats),
+                                     max(st[2] for st in stats))
+            print(f"✓ PSNR (lossless): {self.embed_stats['psnr']:.2f} dB, "
+                  f"{self.embed_stats['modified_samples']} sampel berubah")
+
             # Verifikasi embedding
-            verify_bits = self._extract_bits_sequential(1, 0, len(self.SIGNATURE) * 8)
+            n_signature_bits = len(self.SIGNATURE) * 8
+            verify_bits = self._ungroup_bits(
+                self._gather_lsb(written, 1, start_sample=0, count=n_signature_bits), 1, n_signature_bits)
             verify_data = self._bits_to_bytes(verify_bits)
             if verify_data == self.SIGNATURE:
                 print("✓ Embedding verification: Signature match")
@@ -435,38 +1364,189 @@ class AudioSteganography:
                 print("✗ Embedding verification: Signature mismatch")
                 print(f"  Expected: {self.SIGNATURE.hex()}")
                 print(f"  Got: {verify_data.hex()}")
-            
+
             return True
-            
+
+        except OperationCancelled:
+            for stream in streams:
+                stream.abort()
+            raise
         except Exception as e:
+            for stream in streams:
+                stream.abort()
             print(f"Error embedding bits: {e}")
             import traceback
             traceback.print_exc()
             return False
 
-    def embed_message(self, secret_file: str, output_file: str, 
-                     stego_key: str, n_lsb: int = 1, 
-                     use_encryption: bool = False, 
-                     use_random: bool = False) -> bool:
-        """Sisipkan pesan rahasia ke dalam audio"""
+    @staticmethod
+    def _key_tag(stego_key: str, salt: bytes, iterations: Optional[int]) -> str:
+        """Tag pendek dari kunci stego untuk verifikasi kunci.
+
+        iterations=None hanya untuk file lama: satu putaran SHA-256 (salt + kunci).
+        """
+        if iterations is None:
+            digest = hashlib.sha256(salt + stego_key.encode('utf-8')).digest()
+        else:
+            digest = hashlib.pbkdf2_hmac('sha256', stego_key.encode('utf-8'), salt, iterations,
+                                         dklen=AudioSteganography.KEY_CHECK_BYTES)
+        return digest[:AudioSteganography.KEY_CHECK_BYTES].hex()
+
+    def verify_key(self, metadata: Dict, stego_key: str) -> bool:
+        """Cek kunci terhadap tag di header; file tanpa tag selalu lolos"""
+        if 'key_check' not in metadata:
+            return True
         try:
-            # Baca file pesan rahasia
-            with open(secret_file, 'rb') as f:
-                secret_data = f.read()
-            
+            salt = bytes.fromhex(metadata.get('key_salt', ''))
+        except ValueError:
+            return False
+        iterations = None
+        if 'key_kdf' in metadata:
+            iterations = metadata.get('key_iterations')
+            if (metadata['key_kdf'] != self.KEY_CHECK_KDF or not isinstance(iterations, int)
+                    or not 1 <= iterations <= self.KEY_CHECK_MAX_ITERATIONS):
+                print("✗ Error: Parameter verifikasi kunci di header tidak valid")
+                return False
+        return hmac.compare_digest(self._key_tag(stego_key, salt, iterations), str(metadata['key_check']))
+
+    def _build_metadata(self, secret_name: str, file_size: int, n_lsb: int,
+                        use_encryption: bool, use_random: bool,
+                        stego_key: Optional[str] = None,
+                        shard: Optional[Dict] = None,
+                        size_only: bool = False) -> bytes:
+        """Metadata JSON yang disisipkan setelah signature
+
+        Jika stego_key diberikan, metadata memuat salt, parameter KDF dan tag kunci
+        sehingga ekstraksi dengan kunci salah dapat ditolak setelah membaca header saja.
+        shard ({'payload_id', 'seq', 'total', 'payload_size'}) menandai file
+        sebagai bagian dari payload yang disebar ke beberapa cover.
+        size_only=True untuk menghitung panjang saja: tag tidak diturunkan (panjangnya tetap).
+        """
+        file_info = {
+            'original_name': os.path.basename(secret_name),
+            'file_size': file_size,
+            'extension': os.path.splitext(secret_name)[1],
+            'encrypted': use_encryption,
+            'random_positions': use_random,
+            'n_lsb': n_lsb
+        }
+        if use_random:
+            file_info['prng'] = self.PRNG
+        if stego_key is not None:
+            salt = os.urandom(self.KEY_SALT_BYTES)
+            file_info['key_salt'] = salt.hex()
+            file_info['key_kdf'] = self.KEY_CHECK_KDF
+            file_info['key_iterations'] = self.KEY_CHECK_ITERATIONS
+            file_info['key_check'] = ('00' * self.KEY_CHECK_BYTES if size_only
+                                      else self._key_tag(stego_key, salt, self.KEY_CHECK_ITERATIONS))
+        if shard is not None:
+            file_info['shard'] = shard
+        return json.dumps(file_info, ensure_ascii=False).encode('utf-8')
+
+    def shard_capacity(self, n_lsb: int, metadata_size: int) -> int:
+        """Bytes data rahasia yang muat setelah header berukuran metadata_size"""
+        if self.audio_data is None:
+            return 0
+        data_samples = self.audio_data.size - self._header_samples(metadata_size)
+        by_samples = max(0, data_samples) * n_lsb // 8
+        # Batas yang sama dengan pengecekan kapasitas di embed_bytes
+        by_check = (self.calculate_capacity(n_lsb) - len(self.SIGNATURE)
+                    - self.METADATA_SIZE_BYTES - metadata_size)
+        return max(0, min(by_samples, by_check))
+
+    def _header_samples(self, metadata_size: int) -> int:
+        """Jumlah sampel (1-LSB) yang dipakai signature + ukuran metadata + metadata"""
+        return (len(self.SIGNATURE) + self.METADATA_SIZE_BYTES + metadata_size) * 8
+
+    @staticmethod
+    def _expected_sq_error(samples: np.ndarray, n_lsb: int) -> float:
+        """Jumlah ekspektasi (x - y)^2 jika n LSB sampel diganti bit acak seragam.
+
+        Untuk LSB cover c dan nilai baru v ~ U{0..M}, M = 2^n - 1:
+        E[(c - v)^2] = c^2 - c*M + M(2M + 1)/6.
+        """
+        if samples.size == 0:
+            return 0.0
+        M = (1 << n_lsb) - 1
+        hist = np.bincount((samples & M).astype(np.int64), minlength=M + 1).astype(np.float64)
+        c = np.arange(M + 1, dtype=np.float64)
+        return float(np.dot(hist, c * c - c * M + M * (2 * M + 1) / 6))
+
+    def plan(self, secret_size: int, psnr_floor: float, secret_name: str = "secret",
+             use_encryption: bool = False, use_random: Optional[bool] = None,
+             use_key_check: bool = True) -> Dict:
+        """Pilih n_lsb dan mode termurah yang memenuhi kapasitas dan PSNR minimum.
+
+        MSE dihitung analitis dari distribusi LSB cover (tanpa trial embedding),
+        dengan asumsi bit payload seragam. use_random=None mempertimbangkan kedua
+        mode. Biaya: mode berurutan lebih murah dari acak, lalu sampel tersentuh
+        paling sedikit.
+        """
+        if self.audio_data is None:
+            raise ValueError("Audio data tidak dimuat")
+
+        flat_audio = self._flat_audio()
+        total_samples = flat_audio.size
+        modes = [False, True] if use_random is None else [use_random]
+        candidates = []
+        for mode in modes:
+            for n_lsb in range(1, 5):
+                # Panjang tag tidak bergantung pada kunci, jadi kunci dummy cukup
+                metadata = self._build_metadata(secret_name, secret_size, n_lsb, use_encryption, mode,
+                                                "" if use_key_check else None, size_only=True)
+                header_samples = self._header_samples(len(metadata))
+                data_samples = (secret_size * 8 + n_lsb - 1) // n_lsb
+                # Batas yang sama dengan embed_bytes (sampel dan calculate_capacity)
+                fits_capacity = secret_size <= self.shard_capacity(n_lsb, len(metadata))
+
+                sq_error = self._expected_sq_error(flat_audio[:header_samples], 1)
+                if mode:
+                    # Posisi acak tersebar seragam di luar header
+                    rest = flat_audio[header_samples:]
+                    if rest.size:
+                        sq_error += self._expected_sq_error(rest, n_lsb) * min(1.0, data_samples / rest.size)
+                else:
+                    sq_error += self._expected_sq_error(
+                        flat_audio[header_samples:header_samples + data_samples], n_lsb)
+
+                mse = sq_error / total_samples if total_samples else float('inf')
+                psnr = float('inf') if mse == 0 else float(10 * np.log10(32767.0 ** 2 / mse))
+                candidates.append({
+                    'n_lsb': n_lsb,
+                    'use_random': mode,
+                    'samples_touched': header_samples + data_samples,
+                    'expected_mse': mse,
+                    'expected_psnr': psnr,
+                    'fits_capacity': fits_capacity,
+                    'meets_psnr': psnr >= psnr_floor,
+                })
+
+        fitting = [c for c in candidates if c['fits_capacity'] and c['meets_psnr']]
+        best = min(fitting, key=lambda c: (c['use_random'], c['samples_touched']), default=None)
+        return {'recommended': best, 'candidates': candidates}
+
+    @profiled_stage('embed')
+    def embed_bytes(self, secret_data: Union[bytes, memoryview], secret_name: str,
+                    stego_key: str, n_lsb: int = 1,
+                    use_encryption: bool = False,
+                    use_random: bool = False,
+                    use_key_check: bool = True,
+                    copy_on_touch: bool = False,
+                    shard: Optional[Dict] = None) -> bool:
+        """Sisipkan pesan rahasia (bytes di memori) ke dalam audio yang sudah dimuat.
+
+        copy_on_touch=True membiarkan audio_data utuh dan menyimpan hasilnya
+        sebagai delta di self.embed_delta (dipakai oleh CoverSession).
+        shard diteruskan ke metadata (lihat embed_sharded).
+        """
+        try:
+            secret_data = bytes(secret_data)
             print(f"✓ File rahasia: {len(secret_data)} bytes")
             
             # Persiapkan metadata
-            file_info = {
-                'original_name': os.path.basename(secret_file),
-                'file_size': len(secret_data),
-                'extension': os.path.splitext(secret_file)[1],
-                'encrypted': use_encryption,
-                'random_positions': use_random,
-                'n_lsb': n_lsb
-            }
-            
-            metadata = json.dumps(file_info, ensure_ascii=False).encode('utf-8')
+            metadata = self._build_metadata(secret_name, len(secret_data), n_lsb,
+                                            use_encryption, use_random,
+                                            stego_key if use_key_check else None, shard)
             metadata_size = len(metadata)
             metadata_size_bytes = struct.pack('<I', metadata_size)
             
@@ -497,24 +1577,175 @@ class AudioSteganography:
             print(f"✓ Kapasitas tersedia: {capacity} bytes")
             
             # Sisipkan data
-            if not self._embed_bits(full_data, n_lsb, use_random, stego_key):
+            return self._embed_bits(full_data, n_lsb, use_random, stego_key, copy_on_touch)
+            
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            print(f"✗ Error embedding message: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+    def embed_message(self, secret_file: str, output_file: str, 
+                     stego_key: str, n_lsb: int = 1, 
+                     use_encryption: bool = False, 
+                     use_random: bool = False,
+                     output_formats: Optional[List[str]] = None,
+                     use_key_check: bool = True,
+                     patch_in_place: bool = False) -> bool:
+        """Sisipkan pesan rahasia ke dalam audio
+
+        Jika output_formats diberikan (subset dari OUTPUT_FORMATS), hanya format
+        tersebut yang ditulis sebagai <output_file tanpa ekstensi>.<format>.
+        Tanpa output_formats, format ditentukan dari ekstensi output_file.
+
+        patch_in_place=True (cover dan output WAV): output dibuat dengan patch_wav,
+        audio_data tetap berisi cover dan hasilnya ada di embed_delta.
+        """
+        try:
+            # Baca file pesan rahasia
+            with open(secret_file, 'rb') as f:
+                secret_data = f.read()
+
+            patch = (patch_in_place and output_formats is None
+                     and self.source_path is not None
+                     and self.source_path.lower().endswith('.wav')
+                     and output_file.lower().endswith('.wav'))
+            if not self.embed_bytes(secret_data, secret_file, stego_key, n_lsb,
+                                    use_encryption, use_random, use_key_check,
+                                    copy_on_touch=patch):
                 return False
+
+            if patch:
+                if self.patch_wav(self.source_path, output_file):
+                    return True
+                # Cover tidak bisa di-patch (mis. bukan PCM 16-bit): tulis utuh
+                self.audio_data = StegoDelta.from_embed_delta(
+                    self.embed_delta, self.audio_data.size).apply(self.audio_data)
             
             # Simpan hasil
+            if output_formats is not None:
+                self.save_outputs(output_file, output_formats)
+                return True
             return self.save_audio(output_file)
             
+        except OperationCancelled:
+            raise
         except Exception as e:
             print(f"✗ Error embedding message: {e}")
             import traceback
             traceback.print_exc()
             return False
     
-    def extract_message(self, stego_key: str) -> bool:
-        """Ekstrak pesan rahasia dari audio (FIXED)"""
+    def update_message(self, stego_file: str, secret_file: str, stego_key: str,
+                       new_key: Optional[str] = None, n_lsb: Optional[int] = None,
+                       use_encryption: Optional[bool] = None,
+                       use_random: Optional[bool] = None,
+                       use_key_check: bool = True,
+                       output_file: Optional[str] = None) -> bool:
+        """Ganti pesan di file stego WAV tanpa cover asli.
+
+        Header lama dibaca (dan kuncinya diverifikasi), lalu hanya region header
+        dan posisi payload yang ditulis: posisi untuk pesan baru, dan LSB sisa
+        payload lama yang tidak tertimpa diisi bit acak agar tidak tersisa data
+        lama. Parameter None mengikuti nilai di file lama. Tanpa output_file,
+        file stego_file di-patch langsung.
+        """
+        try:
+            if not self.map_wav(stego_file):
+                return False
+            header = self.read_header()
+            if header is None:
+                return False
+            old_metadata, old_start = header
+            if not self.verify_key(old_metadata, stego_key):
+                print("✗ Error: Kunci stego tidak cocok dengan file")
+                return False
+
+            old_n_lsb = old_metadata['n_lsb']
+            new_key = new_key or stego_key
+            n_lsb = n_lsb or old_n_lsb
+            use_encryption = old_metadata['encrypted'] if use_encryption is None else use_encryption
+            use_random = old_metadata['random_positions'] if use_random is None else use_random
+
+            # Posisi payload lama (dihitung dari header, tanpa membaca payload)
+            old_samples = min((old_metadata['file_size'] * 8 + old_n_lsb - 1) // old_n_lsb,
+                              self.audio_data.size - old_start)
+            if old_metadata['random_positions']:
+                old_positions = self._random_data_positions(
+                    stego_key, old_start, old_samples, old_metadata.get('prng', self.PRNG_LEGACY))
+            else:
+                old_positions = np.arange(old_start, old_start + old_samples, dtype=np.int64)
+
+            with open(secret_file, 'rb') as f:
+                secret_data = f.read()
+            if not self.embed_bytes(secret_data, secret_file, new_key, n_lsb,
+                                    use_encryption, use_random, use_key_check,
+                                    copy_on_touch=True):
+                return False
+
+            self.embed_delta = self._clear_leftover(self.embed_delta, old_start, old_positions,
+                                                    old_n_lsb, max(n_lsb, old_n_lsb))
+            return self.patch_wav(stego_file, output_file or stego_file)
+
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            print(f"✗ Error updating message: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+    def _clear_leftover(self, delta: list, old_header_samples: int, old_positions: np.ndarray,
+                        old_n_lsb: int, delta_n_lsb: int) -> list:
+        """Gabungkan delta embedding baru dengan pengacakan LSB payload lama yang tersisa.
+
+        Bit lama yang tidak ditimpa pesan baru (posisi yang tidak dipakai lagi,
+        atau bit di atas n_lsb baru) diganti bit acak.
+        """
+        new_positions = np.concatenate([
+            positions if positions is not None
+            else np.arange(start, start + len(touched), dtype=np.int64)
+            for positions, start, touched, _ in delta])
+        new_values = np.concatenate([touched for _, _, touched, _ in delta])
+        new_masks = np.concatenate([np.full(len(touched), (1 << n) - 1, dtype=np.int16)
+                                    for _, _, touched, n in delta])
+        order = np.argsort(new_positions, kind='stable')
+        new_positions, new_values, new_masks = new_positions[order], new_values[order], new_masks[order]
+
+        old_all = np.concatenate([np.arange(old_header_samples, dtype=np.int64),
+                                  old_positions.astype(np.int64, copy=False)])
+        old_masks = np.concatenate([np.ones(old_header_samples, dtype=np.int16),
+                                    np.full(len(old_positions), (1 << old_n_lsb) - 1, dtype=np.int16)])
+
+        idx = np.minimum(np.searchsorted(new_positions, old_all), len(new_positions) - 1)
+        hit = new_positions[idx] == old_all
+        clear = old_masks & ~np.where(hit, new_masks[idx], 0).astype(np.int16)
+        dirty = clear != 0
+        noise = np.random.default_rng().integers(0, 1 << 15, size=len(old_all), dtype=np.int16)
+
+        # Posisi yang juga ditulis pesan baru: acak bit lama di atas n_lsb baru
+        rewrite = dirty & hit
+        new_values[idx[rewrite]] = ((new_values[idx[rewrite]] & ~clear[rewrite])
+                                    | (noise[rewrite] & clear[rewrite]))
+
+        # Posisi lama yang tidak dipakai lagi: acak LSB-nya
+        stale = dirty & ~hit
+        stale_positions = old_all[stale]
+        stale_values = ((self._flat_audio()[stale_positions] & ~clear[stale])
+                        | (noise[stale] & clear[stale]))
+        print(f"✓ {len(stale_positions)} sampel sisa payload lama diacak")
+
+        return [(new_positions, 0, new_values, delta_n_lsb),
+                (stale_positions, 0, stale_values.astype(new_values.dtype), delta_n_lsb)]
+
+    def read_header(self) -> Optional[Tuple[Dict, int]]:
+        """Baca signature dan metadata, mengembalikan (metadata, sample awal data)"""
         try:
             if self.audio_data is None:
                 print("✗ Error: Audio data tidak dimuat")
-                return False
+                return None
             
             total_samples = self.audio_data.size
             print(f"Memulai ekstraksi dari {total_samples} samples...")
@@ -528,7 +1759,7 @@ class AudioSteganography:
             
             if signature_data != self.SIGNATURE:
                 print("✗ Error: Signature tidak valid. File mungkin tidak mengandung pesan tersembunyi.")
-                return False
+                return None
             
             print("✓ Signature valid ditemukan")
             
@@ -539,14 +1770,14 @@ class AudioSteganography:
             
             if len(metadata_size_data) < self.METADATA_SIZE_BYTES:
                 print("✗ Error: Tidak dapat membaca ukuran metadata")
-                return False
+                return None
                 
             metadata_size = struct.unpack('<I', metadata_size_data)[0]
             print(f"✓ Ukuran metadata: {metadata_size} bytes")
             
             if metadata_size > 10000 or metadata_size == 0:
                 print(f"✗ Error: Ukuran metadata tidak valid: {metadata_size}")
-                return False
+                return None
             
             # 3. Ekstrak metadata (dengan 1-LSB berurutan)
             metadata_start_sample = metadata_size_start_sample + (self.METADATA_SIZE_BYTES * 8)
@@ -561,14 +1792,14 @@ class AudioSteganography:
                 print(f"✗ Error parsing metadata: {e}")
                 print(f"Metadata raw (hex): {metadata_data.hex()}")
                 print(f"Metadata raw: {metadata_data[:100]}...")
-                return False
+                return None
             
             # Validasi metadata
             required_keys = ['file_size', 'n_lsb', 'encrypted', 'random_positions']
             if not all(key in metadata for key in required_keys):
                 print(f"✗ Error: Metadata tidak lengkap")
                 print(f"Metadata keys: {list(metadata.keys())}")
-                return False
+                return None
             
             n_lsb = metadata['n_lsb']
             use_random = metadata['random_positions']
@@ -577,33 +1808,109 @@ class AudioSteganography:
             
             print(f"✓ Parameter ekstraksi: n_lsb={n_lsb}, random={use_random}, encrypted={use_encryption}, file_size={file_size}")
             
-            # 4. Ekstrak data rahasia dengan n-LSB
             data_start_sample = metadata_start_sample + (metadata_size * 8)
-            data_bits_needed = file_size * 8
-            
-            print(f"✓ Memulai ekstraksi data dari sample {data_start_sample} dengan n_lsb={n_lsb}")
-            
-            if use_random:
-                secret_bits = self._extract_bits_random(n_lsb, data_start_sample, 
-                                            data_bits_needed, stego_key)
-            else:
-                secret_bits = self._extract_bits_sequential(n_lsb, data_start_sample, data_bits_needed)
-            
-            secret_data = self._bits_to_bytes(secret_bits)
-            
-            if len(secret_data) > file_size:
-                secret_data = secret_data[:file_size]
-                print(f"✓ Data dipotong ke {file_size} bytes")
-            
+
+            # file_size dari metadata belum tepercaya (file terpotong/dimanipulasi):
+            # harus muat di sampel setelah header, sebelum ukurannya dipakai (mis. Content-Length)
+            if not isinstance(n_lsb, int) or not 1 <= n_lsb <= 4:
+                print(f"✗ Error: n_lsb tidak valid ({n_lsb})")
+                return None
+            available_bits = max(0, total_samples - data_start_sample) * n_lsb
+            if not isinstance(file_size, int) or file_size < 0 or file_size * 8 > available_bits:
+                print(f"✗ Error: file_size tidak valid ({file_size}), maksimum "
+                      f"{available_bits // 8} bytes setelah header")
+                return None
+            return metadata, data_start_sample
+
+        except Exception as e:
+            print(f"✗ Error reading header: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+
+    def iter_secret(self, metadata: Dict, data_start_sample: int, stego_key: str,
+                    chunk_size: int = None) -> Iterator[bytes]:
+        """Ekstrak (dan dekripsi) data rahasia per potongan ~chunk_size bytes"""
+        n_lsb = metadata['n_lsb']
+        file_size = metadata['file_size']
+        chunk_size = chunk_size or self.EXTRACT_CHUNK_BYTES
+        # Potongan kelipatan n_lsb bytes agar batas potongan jatuh tepat di batas sampel
+        chunk_size = max(n_lsb, chunk_size - chunk_size % n_lsb)
+
+        print(f"✓ Memulai ekstraksi data dari sample {data_start_sample} dengan n_lsb={n_lsb}")
+
+        positions = None
+        if metadata['random_positions']:
+            required_samples = (file_size * 8 + n_lsb - 1) // n_lsb
+            prng = metadata.get('prng', self.PRNG_LEGACY)
+            with self._stage('permutation'):
+                positions = self._random_data_positions(stego_key, data_start_sample, required_samples, prng)
+        cipher = VigenereCipher(stego_key) if metadata['encrypted'] else None
+        flat_audio = self._flat_audio()
+
+        for offset in range(0, file_size, chunk_size):
+            self._check_cancelled()
+            with self._stage('extract'):
+                n_bytes = min(chunk_size, file_size - offset)
+                first_sample = offset * 8 // n_lsb
+                n_samples = (n_bytes * 8 + n_lsb - 1) // n_lsb
+                if positions is not None:
+                    values = self._gather_lsb(flat_audio, n_lsb,
+                                              positions=positions[first_sample:first_sample + n_samples])
+                else:
+                    start = data_start_sample + first_sample
+                    count = max(0, min(n_samples, flat_audio.size - start))
+                    values = self._gather_lsb(flat_audio, n_lsb, start_sample=start, count=count)
+                chunk = self._bits_to_bytes(self._ungroup_bits(values, n_lsb, n_bytes * 8))
+                if cipher is not None:
+                    chunk = cipher.decrypt(chunk, offset)
+            self._report_progress('extract', offset + n_bytes, file_size)
+            yield chunk
+
+    def extract_stream(self, stego_key: str,
+                       chunk_size: int = None) -> Optional[Tuple[Dict, Iterator[bytes]]]:
+        """Baca header lalu kembalikan (metadata, iterator potongan data rahasia)
+
+        Header divalidasi segera; data diekstrak saat iterator dikonsumsi.
+        """
+        header = self.read_header()
+        if header is None:
+            return None
+        metadata, data_start_sample = header
+        if not self.verify_key(metadata, stego_key):
+            print("✗ Error: Kunci stego salah (key check tidak cocok)")
+            return None
+        return metadata, self.iter_secret(metadata, data_start_sample, stego_key, chunk_size)
+
+    def extract_bytes(self, stego_key: str) -> Optional[Tuple[bytes, Dict]]:
+        """Ekstrak pesan rahasia dari audio ke memori, mengembalikan (data, metadata)"""
+        try:
+            stream = self.extract_stream(stego_key)
+            if stream is None:
+                return None
+            metadata, chunks = stream
+
+            secret_data = b''.join(chunks)
             print(f"✓ Data rahasia diekstrak: {len(secret_data)} bytes")
-            
-            # Dekripsi jika diperlukan
-            if use_encryption:
-                print("✓ Mendekripsi data...")
-                cipher = VigenereCipher(stego_key)
-                secret_data = cipher.decrypt(secret_data)
-                print(f"✓ Data terdekripsi: {len(secret_data)} bytes")
-             # --- Buat nama file otomatis ---
+            return secret_data, metadata
+
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            print(f"✗ Error extracting message: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+
+    def extract_message(self, stego_key: str) -> bool:
+        """Ekstrak pesan rahasia dari audio ke uploads/extracted"""
+        try:
+            extracted = self.extract_bytes(stego_key)
+            if extracted is None:
+                return False
+            secret_data, metadata = extracted
+
+            # --- Buat nama file otomatis ---
             original_name = metadata.get("original_name", "file_terekstrak")
             original_name, _ = os.path.splitext(original_name)
             original_ext = metadata.get("extension", "")
@@ -624,12 +1931,46 @@ class AudioSteganography:
             print(f"✓ Pesan berhasil diekstrak ke: {out_path}")
             return str(out_path)
             
+        except OperationCancelled:
+            raise
         except Exception as e:
             print(f"✗ Error extracting message: {e}")
             import traceback
             traceback.print_exc()
             return False
     
+    @staticmethod
+    def psnr_from_arrays(x: np.ndarray, y: np.ndarray) -> float:
+        """Hitung PSNR dari dua array PCM 16-bit yang sudah didekode"""
+        x = x.reshape(-1)
+        y = y.reshape(-1)
+
+        # Align jumlah sampel (ambil minimum)
+        N = min(len(x), len(y))
+        x = x[:N]
+        y = y[:N]
+        
+        print(f"✓ Jumlah sampel ter-align (N): {N:,}")
+        
+        # Hitung MSE = (1/N) * Σ(x[n] - y[n])²
+        differences = x.astype(np.float64) - y.astype(np.float64)
+        squared_diff = differences ** 2
+        mse = np.sum(squared_diff) / N
+        
+        print(f"✓ MSE: {mse:.6f}")
+        
+        # Jika MSE = 0, audio identik (PSNR = infinity)
+        if mse == 0:
+            print("✓ MSE = 0, audio PCM identik!")
+            return float('inf')
+        
+        # MAX untuk 16-bit PCM signed
+        MAX = 32767.0
+        
+        # Hitung PSNR = 10 * log10(MAX² / MSE)
+        return float(10 * np.log10((MAX ** 2) / mse))
+
+    @profiled_stage('psnr')
     def calculate_psnr(self, original_audio_path: str, stego_audio_path: str) -> Optional[float]:
         temp_files = []  # Track temporary files untuk cleanup
         
@@ -658,13 +1999,13 @@ class AudioSteganography:
                 
                 # Load audio
                 if ext == '.mp3':
-                    audio = AudioSegment.from_mp3(file_path)
+                    audio = _audio_segment().from_mp3(file_path)
                 elif ext == '.flac':
-                    audio = AudioSegment.from_file(file_path, format="flac")
+                    audio = _audio_segment().from_file(file_path, format="flac")
                 elif ext == '.ogg':
-                    audio = AudioSegment.from_ogg(file_path)
+                    audio = _audio_segment().from_ogg(file_path)
                 else:
-                    audio = AudioSegment.from_file(file_path)
+                    audio = _audio_segment().from_file(file_path)
                 
                 # Buat temporary WAV file
                 import tempfile
@@ -692,8 +2033,8 @@ class AudioSteganography:
             print("="*50)
             
             # Load audio WAV (x[n] dan y[n])
-            original_audio = AudioSegment.from_wav(original_wav_path)
-            stego_audio = AudioSegment.from_wav(stego_wav_path)
+            original_audio = _audio_segment().from_wav(original_wav_path)
+            stego_audio = _audio_segment().from_wav(stego_wav_path)
             
             # Konversi ke numpy array (16-bit PCM)
             x = np.array(original_audio.get_array_of_samples(), dtype=np.int16)
@@ -709,32 +2050,7 @@ class AudioSteganography:
             if stego_audio.channels == 2:
                 y = y.reshape(-1, 2).flatten()
             
-            # Align jumlah sampel (ambil minimum)
-            N = min(len(x), len(y))
-            x = x[:N]
-            y = y[:N]
-            
-            print(f"✓ Jumlah sampel ter-align (N): {N:,}")
-            
-            # Hitung MSE = (1/N) * Σ(x[n] - y[n])²
-            differences = x.astype(np.float64) - y.astype(np.float64)
-            squared_diff = differences ** 2
-            mse = np.sum(squared_diff) / N
-            
-            print(f"✓ MSE: {mse:.6f}")
-            
-            # Jika MSE = 0, audio identik (PSNR = infinity)
-            if mse == 0:
-                print("✓ MSE = 0, audio PCM identik!")
-                return float('inf')
-            
-            # MAX untuk 16-bit PCM signed
-            MAX = 32767.0
-            
-            # Hitung PSNR = 10 * log10(MAX² / MSE)
-            psnr = 10 * np.log10((MAX ** 2) / mse)
-            
-            return psnr
+            return self.psnr_from_arrays(x, y)
             
         except Exception as e:
             print(f"✗ Error calculating PSNR: {e}")
@@ -753,6 +2069,362 @@ class AudioSteganography:
                     print(f"⚠ Warning: Gagal hapus temporary file {temp_file}: {e}")
 
 
+class StegoOutput:
+    """Hasil embedding dari CoverSession: cover bersama + delta sampel yang berubah.
+
+    Audio stego lengkap baru dibuat (materialize) saat diekspor, sehingga
+    banyak output dari satu cover hanya memakan memori sebesar deltanya.
+    """
+
+    def __init__(self, session: "CoverSession", delta: list, embed_stats: Dict):
+        self.session = session
+        self.delta = delta
+        self.embed_stats = embed_stats
+
+    @property
+    def delta_bytes(self) -> int:
+        """Memori yang dipakai delta (posisi + sampel baru)"""
+        return sum(touched.nbytes + (positions.nbytes if positions is not None else 0)
+                   for positions, _, touched, _ in self.delta)
+
+    def materialize(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Salinan cover dengan delta diterapkan (bentuk sama dengan cover).
+
+        Dengan out, hasil ditulis ke buffer tersebut (mis. shared memory) alih-alih array baru.
+        """
+        if out is None:
+            flat_audio = self.session.audio_data.reshape(-1).copy()
+        else:
+            if out.shape != self.session.audio_data.shape:
+                raise ValueError(f"Buffer output {out.shape} tidak cocok dengan cover "
+                                 f"{self.session.audio_data.shape}")
+            np.copyto(out, self.session.audio_data)
+            flat_audio = out.reshape(-1)
+        for positions, start_sample, touched, _ in self.delta:
+            if positions is not None:
+                flat_audio[positions] = touched
+            else:
+                flat_audio[start_sample:start_sample + len(touched)] = touched
+        return flat_audio.reshape(self.session.audio_data.shape)
+
+    def engine(self, **engine_kwargs) -> "AudioSteganography":
+        """AudioSteganography berisi audio stego (mis. untuk ekstraksi atau ekspor)"""
+        stego = self.session.new_engine(**engine_kwargs)
+        stego.audio_data = self.materialize()
+        stego.embed_stats = self.embed_stats
+        return stego
+
+    def to_bytes(self, format_name: str = 'wav') -> bytes:
+        return self.engine().to_bytes(format_name)
+
+    def export_audio(self, file_path: Union[str, BinaryIO], format_name: str) -> bool:
+        return self.engine().export_audio(file_path, format_name)
+
+    def save_outputs(self, base_path: str, output_formats: List[str]) -> Dict[str, str]:
+        return self.engine().save_outputs(base_path, output_formats)
+
+    def to_delta(self) -> "StegoDelta":
+        return StegoDelta.from_embed_delta(self.delta, self.session.audio_data.size)
+
+
+class CoverSession:
+    """Cover yang di-decode sekali lalu dipakai read-only untuk banyak embedding.
+
+    Setiap embed() menghasilkan StegoOutput independen; cover tidak pernah
+    diubah sehingga aman dipakai bersamaan dari beberapa thread.
+    """
+
+    def __init__(self, audio_data: np.ndarray, sample_rate: int, channels: int, **engine_kwargs):
+        self.audio_data = audio_data
+        # Cover dikunci agar tidak ada embedding yang menulis langsung ke sini
+        self.audio_data.flags.writeable = False
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # Argumen default untuk AudioSteganography (workers, permutation_cache, ...)
+        self.engine_kwargs = engine_kwargs
+
+    @classmethod
+    def load(cls, file_path: Union[str, BinaryIO, bytes], format: Optional[str] = None,
+             **engine_kwargs) -> Optional["CoverSession"]:
+        """Decode cover sekali; None jika gagal dimuat"""
+        stego = AudioSteganography(**engine_kwargs)
+        if not stego.load_audio(file_path, format):
+            return None
+        return cls.from_engine(stego, **engine_kwargs)
+
+    @classmethod
+    def from_engine(cls, stego: "AudioSteganography", **engine_kwargs) -> "CoverSession":
+        """Ambil alih audio yang sudah dimuat di stego (array-nya menjadi read-only)"""
+        return cls(stego.audio_data, stego.sample_rate, stego.channels, **engine_kwargs)
+
+    def new_engine(self, **engine_kwargs) -> "AudioSteganography":
+        """AudioSteganography yang berbagi cover read-only ini"""
+        stego = AudioSteganography(**{**self.engine_kwargs, **engine_kwargs})
+        stego.audio_data = self.audio_data
+        stego.sample_rate = self.sample_rate
+        stego.channels = self.channels
+        return stego
+
+    def calculate_capacity(self, n_lsb: int) -> int:
+        return self.new_engine().calculate_capacity(n_lsb)
+
+    def embed(self, secret_data: Union[bytes, memoryview], secret_name: str, stego_key: str,
+              n_lsb: int = 1, use_encryption: bool = False, use_random: bool = False,
+              use_key_check: bool = True, **engine_kwargs) -> Optional[StegoOutput]:
+        """Sisipkan satu pesan; None jika gagal. engine_kwargs menimpa default sesi
+        (mis. progress_callback/cancel_token per request)."""
+        stego = self.new_engine(**engine_kwargs)
+        if not stego.embed_bytes(secret_data, secret_name, stego_key, n_lsb=n_lsb,
+                                 use_encryption=use_encryption, use_random=use_random,
+                                 use_key_check=use_key_check, copy_on_touch=True):
+            return None
+        return StegoOutput(self, stego.embed_delta, stego.embed_stats)
+
+
+class StegoDelta:
+    """Delta ringkas antara cover dan stego: indeks sampel yang disentuh + LSB barunya.
+
+    Penerima yang sudah memiliki cover cukup mengunduh delta ini lalu
+    menerapkannya (apply) untuk mendapatkan audio stego yang identik.
+    Format biner:
+      MAGIC (8) | ukuran header JSON (<I) | header JSON | per segmen:
+        [posisi: ukuran (<I) + zlib(selisih posisi terurut, uint32)] (mode acak)
+        ukuran bit (<I) + LSB baru (n_lsb bit per sampel, dipack)
+    Segmen berurutan cukup disimpan sebagai run (start, count).
+    """
+
+    MAGIC = b'STGDELTA'
+    VERSION = 1
+    EXTENSION = '.stgd'
+
+    def __init__(self, total_samples: int, segments: List[Dict]):
+        # segments: {'n_lsb', 'values', dan 'start' (berurutan) atau 'positions' (acak)}
+        self.total_samples = total_samples
+        self.segments = segments
+
+    @classmethod
+    def from_embed_delta(cls, delta: list, total_samples: int) -> "StegoDelta":
+        """Bangun dari embed_delta hasil embedding copy-on-touch"""
+        segments = []
+        for positions, start_sample, touched, n_lsb in delta:
+            values = (touched & ((1 << n_lsb) - 1)).astype(np.uint8)
+            if positions is None:
+                segments.append({'n_lsb': n_lsb, 'start': start_sample, 'values': values})
+            else:
+                # Urutkan posisi agar selisihnya kecil dan mudah dikompresi
+                order = np.argsort(positions, kind='stable')
+                segments.append({'n_lsb': n_lsb, 'positions': positions[order], 'values': values[order]})
+        return cls(total_samples, segments)
+
+    @property
+    def touched_samples(self) -> int:
+        return sum(len(segment['values']) for segment in self.segments)
+
+    def to_bytes(self) -> bytes:
+        header = {'version': self.VERSION, 'total_samples': self.total_samples, 'segments': []}
+        blobs = []
+        for segment in self.segments:
+            n_lsb, values = segment['n_lsb'], segment['values']
+            entry = {'n_lsb': n_lsb, 'count': len(values)}
+            if 'positions' in segment:
+                gaps = np.diff(segment['positions'], prepend=0).astype('<u4')
+                packed_positions = zlib.compress(gaps.tobytes())
+                blobs.append(struct.pack('<I', len(packed_positions)) + packed_positions)
+            else:
+                entry['start'] = segment['start']
+            bits = np.packbits(AudioSteganography._ungroup_bits(values, n_lsb, len(values) * n_lsb)).tobytes()
+            blobs.append(struct.pack('<I', len(bits)) + bits)
+            header['segments'].append(entry)
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        return self.MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes + b''.join(blobs)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "StegoDelta":
+        if data[:len(cls.MAGIC)] != cls.MAGIC:
+            raise ValueError("Bukan file delta stego")
+        offset = len(cls.MAGIC)
+
+        def take_block() -> bytes:
+            nonlocal offset
+            size = struct.unpack_from('<I', data, offset)[0]
+            block = data[offset + 4:offset + 4 + size]
+            if len(block) != size:
+                raise ValueError("File delta terpotong")
+            offset += 4 + size
+            return block
+
+        header = json.loads(take_block().decode('utf-8'))
+        if header.get('version') != cls.VERSION:
+            raise ValueError(f"Versi delta tidak didukung: {header.get('version')}")
+        segments = []
+        for entry in header['segments']:
+            n_lsb, count = entry['n_lsb'], entry['count']
+            segment = {'n_lsb': n_lsb}
+            if 'start' in entry:
+                segment['start'] = entry['start']
+            else:
+                gaps = np.frombuffer(zlib.decompress(take_block()), dtype='<u4')
+                segment['positions'] = np.cumsum(gaps, dtype=np.int64)
+            bits = np.unpackbits(np.frombuffer(take_block(), dtype=np.uint8))[:count * n_lsb]
+            segment['values'] = AudioSteganography._group_bits(bits, n_lsb)
+            segments.append(segment)
+        return cls(header['total_samples'], segments)
+
+    def apply(self, audio_data: np.ndarray) -> np.ndarray:
+        """Terapkan delta ke salinan cover; mengembalikan audio stego (bentuk sama)"""
+        if audio_data.size != self.total_samples:
+            raise ValueError(f"Cover tidak cocok: {audio_data.size} sampel, delta untuk "
+                             f"{self.total_samples} sampel")
+        flat_audio = audio_data.reshape(-1).copy()
+        for segment in self.segments:
+            clear_mask = np.array(~((1 << segment['n_lsb']) - 1)).astype(flat_audio.dtype)
+            values = segment['values'].astype(flat_audio.dtype)
+            if 'positions' in segment:
+                idx = segment['positions']
+            else:
+                idx = slice(segment['start'], segment['start'] + len(values))
+            flat_audio[idx] = (flat_audio[idx] & clear_mask) | values
+        return flat_audio.reshape(audio_data.shape)
+
+
+def apply_delta_file(cover_path: str, delta_path: str, output_path: str) -> bool:
+    """Buat file stego dari cover lokal + file delta (format output dari ekstensi)"""
+    try:
+        with open(delta_path, 'rb') as f:
+            delta = StegoDelta.from_bytes(f.read())
+        stego = AudioSteganography()
+        if not stego.load_audio(cover_path):
+            return False
+        stego.audio_data = delta.apply(stego.audio_data)
+        format_name = os.path.splitext(output_path)[1].lower().lstrip('.') or 'wav'
+        if not stego.export_audio(output_path, format_name):
+            return False
+        print(f"✓ Delta diterapkan: {delta.touched_samples} sampel, disimpan ke {output_path}")
+        return True
+    except Exception as e:
+        print(f"✗ Error menerapkan delta: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def embed_sharded(covers: List[AudioSteganography], secret_data: Union[bytes, memoryview],
+                  secret_name: str, stego_key: str, n_lsb: int = 1,
+                  use_encryption: bool = False, use_random: bool = False,
+                  use_key_check: bool = True, workers: Optional[int] = None) -> Optional[str]:
+    """Sebar satu payload ke beberapa cover yang sudah dimuat, disisipkan paralel.
+
+    Payload dibagi sebanding kapasitas tiap cover; setiap shard membawa header
+    sendiri dengan payload_id, nomor urut (seq) dan jumlah shard (total).
+    Mengembalikan payload_id, atau None jika gagal / tidak muat.
+    """
+    secret_data = bytes(secret_data)
+    payload_id = os.urandom(8).hex()
+    total = len(covers)
+    if total == 0:
+        print("✗ Error: Tidak ada cover")
+        return None
+
+    # Perkiraan ukuran metadata terbesar (seq dan ukuran shard dengan digit maksimum)
+    probe = {'payload_id': payload_id, 'seq': total - 1, 'total': total,
+             'payload_size': len(secret_data)}
+    metadata_size = len(covers[0]._build_metadata(
+        secret_name, len(secret_data), n_lsb, use_encryption, use_random,
+        stego_key if use_key_check else None, probe, size_only=True))
+    capacities = [cover.shard_capacity(n_lsb, metadata_size) for cover in covers]
+    total_capacity = sum(capacities)
+    if len(secret_data) > total_capacity:
+        print(f"✗ Error: Data terlalu besar ({len(secret_data)} bytes) untuk total "
+              f"kapasitas {total} cover ({total_capacity} bytes)")
+        return None
+
+    # Bagi sebanding kapasitas; sisa pembulatan ke cover yang masih punya ruang
+    sizes = [len(secret_data) * capacity // total_capacity if total_capacity else 0
+             for capacity in capacities]
+    remainder = len(secret_data) - sum(sizes)
+    for i in range(total):
+        extra = min(remainder, capacities[i] - sizes[i])
+        sizes[i] += extra
+        remainder -= extra
+
+    def embed_one(seq: int, offset: int) -> bool:
+        shard = {'payload_id': payload_id, 'seq': seq, 'total': total,
+                 'payload_size': len(secret_data)}
+        return covers[seq].embed_bytes(secret_data[offset:offset + sizes[seq]], secret_name,
+                                       stego_key, n_lsb, use_encryption, use_random,
+                                       use_key_check, shard=shard)
+
+    offsets = [sum(sizes[:i]) for i in range(total)]
+    with ThreadPoolExecutor(max_workers=workers or total) as pool:
+        results = list(pool.map(embed_one, range(total), offsets))
+    if not all(results):
+        print("✗ Error: Sebagian shard gagal disisipkan")
+        return None
+    print(f"✓ Payload {payload_id} disebar ke {total} cover: {sizes} bytes")
+    return payload_id
+
+
+def extract_sharded(stegos: List[AudioSteganography], stego_key: str,
+                    workers: Optional[int] = None) -> Optional[Tuple[bytes, Dict]]:
+    """Gabungkan kembali payload dari kumpulan file stego (urutan bebas).
+
+    Mengembalikan (data, metadata) dengan file_size = ukuran payload utuh.
+    """
+    try:
+        shards = {}
+        for stego in stegos:
+            header = stego.read_header()
+            if header is None:
+                return None
+            metadata, data_start_sample = header
+            if not stego.verify_key(metadata, stego_key):
+                print("✗ Error: Kunci stego salah (key check tidak cocok)")
+                return None
+            shard = metadata.get('shard')
+            if shard is None:
+                print("✗ Error: File bukan bagian dari payload multi-cover")
+                return None
+            shards[shard['seq']] = (stego, metadata, data_start_sample)
+
+        shard_infos = [metadata['shard'] for _, metadata, _ in shards.values()]
+        first = shard_infos[0]
+        if any(info['payload_id'] != first['payload_id'] for info in shard_infos):
+            print("✗ Error: File berasal dari payload yang berbeda")
+            return None
+        missing = sorted(set(range(first['total'])) - set(shards))
+        if missing or len(stegos) != first['total']:
+            print(f"✗ Error: Shard tidak lengkap/duplikat (hilang: {missing})")
+            return None
+
+        def extract_one(seq: int) -> bytes:
+            stego, metadata, data_start_sample = shards[seq]
+            return b''.join(stego.iter_secret(metadata, data_start_sample, stego_key))
+
+        with ThreadPoolExecutor(max_workers=workers or len(shards)) as pool:
+            secret_data = b''.join(pool.map(extract_one, range(first['total'])))
+        if len(secret_data) != first['payload_size']:
+            print(f"✗ Error: Ukuran payload tidak cocok ({len(secret_data)} != {first['payload_size']})")
+            return None
+
+        metadata = {key: value for key, value in shards[0][1].items() if key != 'shard'}
+        metadata['file_size'] = len(secret_data)
+        print(f"✓ Payload {first['payload_id']} digabung dari {first['total']} shard: "
+              f"{len(secret_data)} bytes")
+        return secret_data, metadata
+
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        print(f"✗ Error extracting sharded payload: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+# Cache permutasi bersama untuk semua instance AudioSteganography
+PERMUTATION_CACHE = PermutationCache()
+
+
 def main():
     """Fungsi utama program"""
     print("=== Audio Steganography Program (FIXED - Support MP3/WAV/FLAC) ===")
@@ -763,8 +2435,9 @@ def main():
     print("2. Extract message") 
     print("3. Calculate capacity")
     print("4. Calculate PSNR")
+    print("5. Apply delta (cover + delta -> stego)")
     
-    choice = input("\nPilih opsi (1-4): ").strip()
+    choice = input("\nPilih opsi (1-5): ").strip()
     
     stego = AudioSteganography()
     
@@ -814,12 +2487,13 @@ def main():
             print(f"  Perlu: {file_size} bytes, tersedia: {capacity} bytes")
             return
         
+        # WAV -> WAV: clone cover dan tulis hanya sampel yang berubah
         if stego.embed_message(secret_file, output_file, stego_key, 
-                              n_lsb, use_encryption, use_random):
+                              n_lsb, use_encryption, use_random, patch_in_place=True):
             print("\n✅ PENYISIPAN BERHASIL!")
             
             # Hitung PSNR
-            psnr = stego.calculate_psnr(cover_file)
+            psnr = stego.calculate_psnr(cover_file, output_file)
             if psnr is not None:
                 print(f"✓ PSNR: {psnr:.2f} dB")
                 if psnr < 30:
@@ -842,7 +2516,18 @@ def main():
         output_file = input("Path output file hasil ekstraksi: ").strip()
         stego_key = input("Kunci stego: ").strip()
         
-        if stego.extract_message(output_file, stego_key):
+        if output_file:
+            extracted = stego.extract_bytes(stego_key)
+            if extracted is not None:
+                with open(output_file, "wb") as f:
+                    f.write(extracted[0])
+                print(f"✓ Pesan berhasil diekstrak ke: {output_file}")
+            ok = extracted is not None
+        else:
+            # Tanpa path output, simpan ke uploads/extracted dengan nama asli
+            ok = bool(stego.extract_message(stego_key))
+
+        if ok:
             print("\n✅ EKSTRAKSI BERHASIL!")
         else:
             print("\n❌ EKSTRAKSI GAGAL!")
@@ -878,7 +2563,7 @@ def main():
         if not stego.load_audio(stego_file):
             return
         
-        psnr = stego.calculate_psnr(original_file)
+        psnr = stego.calculate_psnr(original_file, stego_file)
         if psnr is not None:
             print(f"✓ PSNR: {psnr:.2f} dB")
             if psnr < 30:
@@ -890,9 +2575,18 @@ def main():
         else:
             print("✗ Gagal menghitung PSNR!")
     
+    elif choice == '5':
+        # Terapkan delta ke cover lokal
+        print("\n=== APPLY DELTA ===")
+        cover_file = input("Path file audio cover: ").strip()
+        delta_file = input(f"Path file delta ({StegoDelta.EXTENSION}): ").strip()
+        output_file = input("Path output stego (WAV/FLAC): ").strip()
+        if not apply_delta_file(cover_file, delta_file, output_file):
+            print("✗ Gagal menerapkan delta!")
+    
     else:
         print("✗ Pilihan tidak valid!")
 
 
-# if __name__ == "__main__":
-#     main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
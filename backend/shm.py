@@ -0,0 +1,142 @@
+import threading
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import script
+from script import CoverSession
+
+# (block name, shape, dtype) - the only thing that crosses a process boundary
+SharedRef = Tuple[str, Tuple[int, ...], str]
+
+
+class SharedPCM:
+    """NumPy array backed by a named multiprocessing.shared_memory block.
+
+    The creating process owns the block and is the only one that unlinks it;
+    other processes attach by ref, use the array in place and close.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype: str,
+                 owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.array: Optional[np.ndarray] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, shape: Tuple[int, ...], dtype: str = "<i2") -> "SharedPCM":
+        size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        return cls(shared_memory.SharedMemory(create=True, size=size), tuple(shape), dtype, owner=True)
+
+    @classmethod
+    def attach(cls, ref: SharedRef) -> "SharedPCM":
+        name, shape, dtype = ref
+        return cls(shared_memory.SharedMemory(name=name), tuple(shape), dtype, owner=False)
+
+    @property
+    def ref(self) -> SharedRef:
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+    @property
+    def nbytes(self) -> int:
+        return self.shm.size
+
+    def close(self) -> None:
+        """Drop this process's mapping.
+
+        If views of the array are still alive elsewhere the mapping stays until
+        they are garbage collected; the block itself is unaffected.
+        """
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
+    def unlink(self) -> None:
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedPCMRegistry:
+    """Blocks owned by this process, so each is unlinked exactly once.
+
+    Every block created here must be passed to release() when the request that
+    created it is done; release_all() is the shutdown backstop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blocks: Dict[str, SharedPCM] = {}
+
+    def create(self, shape: Tuple[int, ...], dtype: str = "<i2") -> SharedPCM:
+        block = SharedPCM.create(shape, dtype)
+        with self._lock:
+            self._blocks[block.shm.name] = block
+        return block
+
+    def copy_of(self, array: np.ndarray) -> SharedPCM:
+        block = self.create(array.shape, array.dtype.str)
+        np.copyto(block.array, array)
+        return block
+
+    def release(self, block: Optional[SharedPCM]) -> None:
+        if block is None:
+            return
+        with self._lock:
+            if self._blocks.pop(block.shm.name, None) is None:
+                return
+        block.close()
+        block.unlink()
+
+    def release_all(self) -> None:
+        with self._lock:
+            blocks = list(self._blocks.values())
+        for block in blocks:
+            self.release(block)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"blocks": len(self._blocks),
+                    "bytes": sum(block.nbytes for block in self._blocks.values())}
+
+
+def init_worker(permutation_cache: dict) -> None:
+    """Process-pool initializer: give the worker a PermutationCache built from the API's settings.
+
+    Without it workers fall back to the module default in script, ignoring the
+    configured memory bound and spill directory. Limits apply per process.
+    """
+    script.PERMUTATION_CACHE = script.PermutationCache(**permutation_cache)
+
+
+def embed_shared(cover_ref: SharedRef, output_ref: SharedRef, sample_rate: int, channels: int,
+                 secret_data: bytes, secret_name: str, stego_key: str, n_lsb: int,
+                 use_encryption: bool, use_random: bool, use_key_check: bool,
+                 workers: Optional[int] = None) -> Optional[dict]:
+    """Process-pool task: embed into the shared cover and write the stego PCM to output_ref.
+
+    Returns the embed stats, or None if embedding failed. The cover block is only
+    read; both blocks stay owned (and are unlinked) by the submitting process.
+    """
+    cover = SharedPCM.attach(cover_ref)
+    output = SharedPCM.attach(output_ref)
+    try:
+        session = CoverSession(cover.array, sample_rate, channels, workers=workers,
+                               permutation_cache=script.PERMUTATION_CACHE)
+        result = session.embed(secret_data, secret_name, stego_key, n_lsb=n_lsb,
+                               use_encryption=use_encryption, use_random=use_random,
+                               use_key_check=use_key_check)
+        if result is None:
+            return None
+        result.materialize(out=output.array)
+        return result.embed_stats
+    finally:
+        # Views into the blocks must be gone before the mappings can close
+        session = result = None
+        output.close()
+        cover.close()
@@ -0,0 +1,470 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterable, BinaryIO, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+
+class QuotaExceededError(Exception):
+    """Raised when an artifact cannot fit in the store even after eviction."""
+
+
+class ArtifactStore:
+    """Disk store for request artifacts with a byte quota and TTL eviction.
+
+    Every artifact lives under its own unique key (root/<kk>/<key>/<name>),
+    so concurrent requests never collide on file names. Keys are evicted as a
+    whole: expired ones by the sweeper, least recently used ones when a write
+    would exceed the quota.
+    """
+
+    TMP_SUFFIX = ".part"
+    KEY_LOCK_STRIPES = 64
+
+    def __init__(self, root: Path, quota_bytes: int, ttl_seconds: float):
+        self.root = Path(root)
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict[str, int]] = {}  # key -> {name: size}
+        self._last_access: Dict[str, float] = {}
+        # Fixed stripe table: unknown or expired keys must not grow it
+        self._key_locks = [threading.Lock() for _ in range(self.KEY_LOCK_STRIPES)]
+        self._used = 0
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def new_key() -> str:
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def _valid(key: str, name: str = "x") -> bool:
+        return key.isalnum() and bool(name) and "/" not in name and "\\" not in name and not name.startswith(".")
+
+    def _key_dir(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    @property
+    def used_bytes(self) -> int:
+        return self._used
+
+    def key_lock(self, key: str) -> threading.Lock:
+        """Lock for work that must happen once per key (e.g. lazy encoding).
+
+        Keys share a fixed set of locks, so never hold two key locks at once.
+        """
+        return self._key_locks[hash(key) % self.KEY_LOCK_STRIPES]
+
+    def put(self, key: str, name: str, data: bytes) -> Path:
+        """Atomically write data as <key>/<name>, evicting LRU keys if needed."""
+        if not self._valid(key, name):
+            raise ValueError(f"Invalid artifact name: {key}/{name}")
+        size = len(data)
+        with self._lock:
+            previous = self._entries.get(key, {}).get(name, 0)
+            self._make_room(size - previous, keep=key)
+            # Reserve before writing so concurrent puts see the space as taken
+            self._entries.setdefault(key, {})[name] = size
+            self._used += size - previous
+            self._last_access[key] = time.time()
+
+        path = self._key_dir(key) / name
+        tmp_path = path.with_name(name + self.TMP_SUFFIX)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            with self._lock:
+                if self._entries.get(key, {}).pop(name, None) is not None:
+                    self._used -= size
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+        return path
+
+    def get(self, key: str, name: str) -> Optional[Path]:
+        """Path of an existing artifact (and mark its key as recently used)."""
+        if not self._valid(key, name):
+            return None
+        with self._lock:
+            if name not in self._entries.get(key, {}):
+                return None
+            self._last_access[key] = time.time()
+        return self._key_dir(key) / name
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            names = self._entries.pop(key, None)
+            self._last_access.pop(key, None)
+            if names:
+                self._used -= sum(names.values())
+        shutil.rmtree(self._key_dir(key), ignore_errors=True)
+
+    def _make_room(self, needed: int, keep: Optional[str] = None) -> None:
+        if needed > self.quota_bytes:
+            raise QuotaExceededError(f"Artifact of {needed} bytes exceeds store quota")
+        candidates = sorted((t, k) for k, t in self._last_access.items() if k != keep)
+        for _, key in candidates:
+            if self._used + needed <= self.quota_bytes:
+                break
+            self.delete(key)
+        if self._used + needed > self.quota_bytes:
+            raise QuotaExceededError("Artifact store quota exceeded")
+
+    def sweep(self) -> int:
+        """Delete keys not accessed within the TTL. Returns number of keys removed."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [key for key, t in self._last_access.items() if t < cutoff]
+        for key in expired:
+            self.delete(key)
+        return len(expired)
+
+    def reconcile(self) -> None:
+        """Rebuild the index from disk at startup, dropping partial and stray files."""
+        with self._lock:
+            self._entries.clear()
+            self._last_access.clear()
+            self._used = 0
+            self.root.mkdir(parents=True, exist_ok=True)
+            for shard in self.root.iterdir():
+                if not shard.is_dir() or len(shard.name) != 2:
+                    self._remove_path(shard)
+                    continue
+                for key_dir in shard.iterdir():
+                    key = key_dir.name
+                    if not key_dir.is_dir() or not self._valid(key) or key[:2] != shard.name:
+                        self._remove_path(key_dir)
+                        continue
+                    for item in key_dir.iterdir():
+                        if not item.is_file() or item.name.endswith(self.TMP_SUFFIX):
+                            self._remove_path(item)
+                            continue
+                        stat = item.stat()
+                        self._entries.setdefault(key, {})[item.name] = stat.st_size
+                        self._used += stat.st_size
+                        self._last_access[key] = max(self._last_access.get(key, 0), stat.st_mtime)
+                    if key not in self._entries:
+                        self._remove_path(key_dir)
+            self.sweep()
+            self._make_room(0)
+
+    @staticmethod
+    def _remove_path(path: Path) -> None:
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+
+    def start_sweeper(self, interval_seconds: float) -> None:
+        if self._sweeper is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Warning: artifact sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="artifact-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+
+
+class UploadSessions:
+    """Resumable chunked uploads stored on disk under root/<upload_id>/.
+
+    A session is created with its total size; chunks are written at explicit
+    byte offsets into a preallocated data file and the received byte ranges are
+    tracked in meta.json, so a client can query what is missing and resume.
+    Finalized uploads can be opened by id. Sessions not touched within the TTL
+    (partial or finalized) are removed by the sweeper; unfinished ones already
+    after abandoned_ttl_seconds. The declared sizes of all sessions together
+    may not exceed quota_bytes, since every session can grow to its full size.
+    """
+
+    DATA_NAME = "data"
+    META_NAME = "meta.json"
+    # Request body pieces are batched into writes of about this size, off the event loop
+    WRITE_BUFFER_BYTES = 1 << 20
+
+    def __init__(self, root: Path, ttl_seconds: float, max_upload_bytes: int,
+                 quota_bytes: int, abandoned_ttl_seconds: Optional[float] = None):
+        self.root = Path(root)
+        self.ttl_seconds = ttl_seconds
+        self.abandoned_ttl_seconds = abandoned_ttl_seconds if abandoned_ttl_seconds is not None else ttl_seconds
+        self.max_upload_bytes = max_upload_bytes
+        self.quota_bytes = quota_bytes
+        self._lock = threading.RLock()
+        self._sessions: Dict[str, dict] = {}
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _dir(self, upload_id: str) -> Path:
+        return self.root / upload_id
+
+    def _save_meta(self, upload_id: str, meta: dict) -> None:
+        path = self._dir(upload_id) / self.META_NAME
+        tmp_path = path.with_name(self.META_NAME + ArtifactStore.TMP_SUFFIX)
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+    @property
+    def reserved_bytes(self) -> int:
+        """Declared size of all sessions (the most they can occupy on disk)."""
+        with self._lock:
+            return sum(meta["total_size"] for meta in self._sessions.values())
+
+    def create(self, total_size: int, filename: str = "") -> dict:
+        if total_size <= 0 or total_size > self.max_upload_bytes:
+            raise ValueError(f"total_size must be between 1 and {self.max_upload_bytes}")
+        upload_id = uuid.uuid4().hex
+        meta = {
+            "upload_id": upload_id,
+            "filename": os.path.basename(filename or ""),
+            "total_size": total_size,
+            "ranges": [],
+            "finalized": False,
+            "updated": time.time(),
+        }
+        with self._lock:
+            if self.reserved_bytes + total_size > self.quota_bytes:
+                # Expired sessions are dropped first; only then is the upload refused
+                self.sweep()
+                if self.reserved_bytes + total_size > self.quota_bytes:
+                    raise QuotaExceededError("Upload storage quota exceeded")
+            # Reserve before touching disk so concurrent creates see the space as taken
+            self._sessions[upload_id] = meta
+        try:
+            session_dir = self._dir(upload_id)
+            session_dir.mkdir(parents=True)
+            # Sparse file: ruang disk baru terpakai saat chunk ditulis
+            with open(session_dir / self.DATA_NAME, "wb") as f:
+                f.truncate(total_size)
+            with self._lock:
+                self._save_meta(upload_id, meta)
+        except Exception:
+            self.delete(upload_id)
+            raise
+        return dict(meta)
+
+    def get(self, upload_id: str) -> Optional[dict]:
+        with self._lock:
+            meta = self._sessions.get(upload_id)
+            return None if meta is None else {**meta, "ranges": [list(r) for r in meta["ranges"]]}
+
+    @staticmethod
+    def _merge(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+        merged = []
+        for r_start, r_end in sorted(ranges + [[start, end]]):
+            if merged and r_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], r_end)
+            else:
+                merged.append([r_start, r_end])
+        return merged
+
+    async def write_chunk(self, upload_id: str, offset: int, stream: AsyncIterable[bytes]) -> dict:
+        """Write an async byte stream (e.g. a request body) at offset; returns updated meta."""
+        with self._lock:
+            meta = self._sessions.get(upload_id)
+            if meta is None:
+                raise KeyError(upload_id)
+            if meta["finalized"]:
+                raise ValueError("Upload already finalized")
+        total_size = meta["total_size"]
+        if offset < 0 or offset >= total_size:
+            raise ValueError("offset out of range")
+
+        # File I/O runs in the threadpool; pieces are batched to keep thread hops few
+        end = offset
+        f = await run_in_threadpool(open, self._dir(upload_id) / self.DATA_NAME, "r+b")
+        try:
+            pending, pending_bytes = [], 0
+            async for piece in stream:
+                if end + pending_bytes + len(piece) > total_size:
+                    raise ValueError("Chunk extends past total_size")
+                pending.append(piece)
+                pending_bytes += len(piece)
+                if pending_bytes >= self.WRITE_BUFFER_BYTES:
+                    await run_in_threadpool(self._write_at, f, end, pending)
+                    end += pending_bytes
+                    pending, pending_bytes = [], 0
+            if pending:
+                await run_in_threadpool(self._write_at, f, end, pending)
+                end += pending_bytes
+        finally:
+            await run_in_threadpool(f.close)
+
+        return await run_in_threadpool(self._record_range, upload_id, meta, offset, end)
+
+    @staticmethod
+    def _write_at(f: BinaryIO, position: int, pieces: List[bytes]) -> None:
+        f.seek(position)
+        f.writelines(pieces)
+
+    def _record_range(self, upload_id: str, meta: dict, start: int, end: int) -> dict:
+        with self._lock:
+            if end > start:
+                meta["ranges"] = self._merge(meta["ranges"], start, end)
+            meta["updated"] = time.time()
+            self._save_meta(upload_id, meta)
+            return self.get(upload_id)
+
+    def finalize(self, upload_id: str, sha256: Optional[str] = None) -> dict:
+        with self._lock:
+            meta = self._sessions.get(upload_id)
+            if meta is None:
+                raise KeyError(upload_id)
+            if meta["ranges"] != [[0, meta["total_size"]]]:
+                raise ValueError("Upload incomplete")
+            if sha256:
+                digest = hashlib.sha256()
+                with open(self._dir(upload_id) / self.DATA_NAME, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(block)
+                if digest.hexdigest() != sha256.lower():
+                    raise ValueError("sha256 mismatch")
+            meta["finalized"] = True
+            meta["updated"] = time.time()
+            self._save_meta(upload_id, meta)
+            return self.get(upload_id)
+
+    def open(self, upload_id: str) -> Tuple[BinaryIO, dict]:
+        """Open a finalized upload for reading; returns (file, meta)."""
+        with self._lock:
+            meta = self._sessions.get(upload_id)
+            if meta is None or not meta["finalized"]:
+                raise KeyError(upload_id)
+            meta["updated"] = time.time()
+            return open(self._dir(upload_id) / self.DATA_NAME, "rb"), self.get(upload_id)
+
+    def delete(self, upload_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    def sweep(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [uid for uid, meta in self._sessions.items()
+                       if meta["updated"] < now - (self.ttl_seconds if meta["finalized"]
+                                                   else self.abandoned_ttl_seconds)]
+        for upload_id in expired:
+            self.delete(upload_id)
+        return len(expired)
+
+    def reconcile(self) -> None:
+        """Reload sessions from disk at startup, dropping unreadable ones."""
+        with self._lock:
+            self._sessions.clear()
+            self.root.mkdir(parents=True, exist_ok=True)
+            for session_dir in self.root.iterdir():
+                try:
+                    with open(session_dir / self.META_NAME) as f:
+                        meta = json.load(f)
+                    if meta.get("upload_id") != session_dir.name or not (session_dir / self.DATA_NAME).is_file():
+                        raise ValueError("inconsistent session")
+                    self._sessions[session_dir.name] = meta
+                except Exception:
+                    ArtifactStore._remove_path(session_dir)
+            self.sweep()
+
+    def start_sweeper(self, interval_seconds: float) -> None:
+        if self._sweeper is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Warning: upload sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="upload-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+
+
+class ResultCache:
+    """In-memory LRU of finished responses keyed by a request digest, bounded in bytes.
+
+    Entries may reference an artifact (key, name) that the response depends on;
+    an entry whose artifact has been evicted from the ArtifactStore is a miss.
+    """
+
+    def __init__(self, max_bytes: int, artifacts: Optional[ArtifactStore] = None):
+        self.max_bytes = max_bytes
+        self.artifacts = artifacts
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[dict, Optional[Tuple[str, str]], int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(**parts) -> str:
+        """Stable digest of the request parts (values must be JSON serializable)."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _size(response: dict) -> int:
+        # Base64 payloads dominate; the fixed part is a rough allowance for the rest
+        return 1024 + sum(len(value) for value in response.values() if isinstance(value, (str, bytes)))
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, artifact, _ = entry
+                if artifact is None or self.artifacts is None or self.artifacts.get(*artifact) is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(response)
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, response: dict, artifact: Optional[Tuple[str, str]] = None) -> None:
+        size = self._size(response)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            while self._entries and self._bytes + size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+            self._entries[key] = (dict(response), artifact, size)
+            self._bytes += size
+
+    def _drop(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
@@ -25,6 +25,7 @@ const EmbedTab = ({ embedState, setEmbedState }) => {
     formData.append("n_lsb", nLSB);
     formData.append("use_encryption", useEncryption);
     formData.append("use_random", useRandomStart);
+    formData.append("output_formats", "wav,mp3");
 
     try {
       setLoading(true);
@@ -45,15 +46,13 @@ const EmbedTab = ({ embedState, setEmbedState }) => {
         { type: "audio/wav" }
       ) : null;
 
-      const mp3Blob = data.mp3_file ? new Blob(
-        [Uint8Array.from(atob(data.mp3_file), c => c.charCodeAt(0))],
-        { type: "audio/mpeg" }
-      ) : null;
+      // MP3 di-encode server saat pertama kali diakses
+      const mp3Url = data.mp3_url ? `http://localhost:8000${data.mp3_url}` : null;
 
       updateState({
         stegoAudio: {
           wav: wavBlob ? { url: URL.createObjectURL(wavBlob), blob: wavBlob, name: data.file_name + "_stego.wav" } : null,
-          mp3: mp3Blob ? { url: URL.createObjectURL(mp3Blob), blob: mp3Blob, name: data.file_name + "_stego.mp3" } : null,
+          mp3: mp3Url ? { url: mp3Url, blob: null, name: data.file_name + "_stego.mp3" } : null,
         },
         psnr: {
           wav: data.psnr_score?.wav?.toFixed(2),
@@ -91,17 +91,17 @@ const AudioSteganographyApp = () => {
         method: "POST",
         body: formData,
       });
-      const data = await res.json();
-
-      if (!data.success) {
+      if (!res.ok) {
+        const data = await res.json();
         alert("Extraction failed: " + data.error);
         return;
       }
 
-      const extractedUrl = `http://localhost:8000/${data.file}`;
-      const response = await fetch(extractedUrl);
-      const blob = await response.blob();
-      const downloadName = data.original_name || "extracted_file";
+      // Server mengirim isi file langsung; nama file dari Content-Disposition
+      const blob = await res.blob();
+      const disposition = res.headers.get("Content-Disposition") || "";
+      const match = disposition.match(/filename\*=UTF-8''([^;]+)/) || disposition.match(/filename="([^"]+)"/);
+      const downloadName = match ? decodeURIComponent(match[1]) : "extracted_file";
       const url = URL.createObjectURL(blob);
 
 